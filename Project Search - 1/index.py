@@ -0,0 +1,268 @@
+from bisect import bisect_left, bisect_right
+from wiki import article_metadata
+import re
+
+# Fields of an article that can be searched, each with its own postings
+FIELDS = ('title', 'keywords')
+
+_TOKEN = re.compile(r'\w+')
+
+def _fold(word):
+  """ Returns the case-folded form used for keyword lookups
+  """
+  return word.lower()
+
+def _title_tokens(title):
+  """ Returns the distinct case-folded words of a title, in order
+  """
+  return list(dict.fromkeys(_TOKEN.findall(_fold(title))))
+
+def split_field(word):
+  """ Returns (word, fields) for a query word, which may name the field to
+  search before a colon, as in 'title:python'; other words search keywords
+  """
+  field, colon, rest = word.partition(':')
+  if colon and rest and _fold(field) in FIELDS:
+    return rest, (_fold(field),)
+  return word, ('keywords',)
+
+def _signature(metadata):
+  """ Returns a cheap fingerprint of a metadata list, used to notice when it
+  has been replaced or had articles added or removed
+  """
+  return (id(metadata), len(metadata))
+
+# Intersections switch from a linear merge to galloping search through the
+# longer posting list when it is at least this many times the shorter one
+GALLOP_RATIO = 8
+
+def _gallop(posting, target, low=0):
+  """ Returns the position of the first row not below target in a sorted
+  posting list, searching from low in doubling steps, then by bisection
+  """
+  end = len(posting)
+  high = low
+  step = 1
+  while high < end and posting[high] < target:
+    low = high + 1
+    high += step
+    step *= 2
+  return bisect_left(posting, target, low, min(high, end))
+
+def intersect(first, second):
+  """ Returns the sorted rows found in both sorted posting lists
+  """
+  result = []
+  if len(first) > len(second):
+    first, second = second, first
+  if len(second) >= GALLOP_RATIO * len(first):
+    # Skewed sizes: look each row of the short list up in the long one
+    position = 0
+    for row in first:
+      position = _gallop(second, row, position)
+      if position == len(second):
+        break
+      if second[position] == row:
+        result.append(row)
+        position += 1
+    return result
+  i, j = 0, 0
+  while i < len(first) and j < len(second):
+    if first[i] < second[j]:
+      i += 1
+    elif first[i] > second[j]:
+      j += 1
+    else:
+      result.append(first[i])
+      i += 1
+      j += 1
+  return result
+
+def union(first, second):
+  """ Returns the sorted rows found in either sorted posting list
+  """
+  result = []
+  i, j = 0, 0
+  while i < len(first) and j < len(second):
+    if first[i] < second[j]:
+      result.append(first[i])
+      i += 1
+    elif first[i] > second[j]:
+      result.append(second[j])
+      j += 1
+    else:
+      result.append(first[i])
+      i += 1
+      j += 1
+  result.extend(first[i:])
+  result.extend(second[j:])
+  return result
+
+def difference(first, second):
+  """ Returns the sorted rows of the first sorted posting list that are not
+  in the second
+  """
+  result = []
+  position = 0
+  for row in first:
+    position = _gallop(second, row, position)
+    if position == len(second) or second[position] != row:
+      result.append(row)
+  return result
+
+# Columns of a metadata row with a NumericIndex for range filters
+NUMERIC_FIELDS = {'timestamp': 2, 'length': 3}
+
+class NumericIndex:
+  """Sorted column of one numeric field of every row, for range filters
+
+  Rows are kept sorted by value, so the rows with a value in a range are one
+  slice found by two bisections, without looking at any row's value. Each
+  row's rank in that order is kept too, so filter() can tell whether a row
+  of a posting list falls in the slice with one list lookup, like a bitmap
+  of the range, keeping rows the posting list repeats.
+
+  Args:
+    values - the field's value for each row, in row order
+  """
+
+  def __init__(self, values):
+    self.order = sorted(range(len(values)), key=values.__getitem__)
+    self.values = [values[row] for row in self.order]
+    self.ranks = [0] * len(self.order)
+    for rank, row in enumerate(self.order):
+      self.ranks[row] = rank
+
+  def __len__(self):
+    return len(self.order)
+
+  def _bounds(self, low, high):
+    start = 0 if low is None else bisect_left(self.values, low)
+    end = len(self.values) if high is None else bisect_right(self.values, high)
+    return start, end
+
+  def span(self, low=None, high=None):
+    """ Returns the rows with low <= value <= high, in value order; a bound of
+    None leaves that side open
+    """
+    start, end = self._bounds(low, high)
+    return self.order[start:end]
+
+  def rows(self, low=None, high=None):
+    """ Returns the sorted rows with low <= value <= high
+    """
+    return sorted(self.span(low, high))
+
+  def filter(self, posting, low=None, high=None):
+    """ Returns the rows of a posting list with low <= value <= high, in its
+    order and as often as it lists them
+    """
+    start, end = self._bounds(low, high)
+    if end - start == len(self.order):
+      return posting
+    ranks = self.ranks
+    return [row for row in posting if start <= ranks[row] < end]
+
+class MetadataIndex:
+  """Case-folded keyword to row index over a 2D list of article metadata
+
+  Each keyword maps to the positions of the rows that list it, in row order,
+  so a query reads its rows straight from the posting list instead of
+  scanning every keyword of every article. A row that lists a keyword more
+  than once appears once per occurrence, like a linear scan would return it.
+
+  The words of each title are indexed the same way in postings of their
+  own, once per row, so a word can be looked up in titles, keywords or
+  both; see FIELDS.
+
+  Args:
+    metadata - 2D list of article metadata containing
+               [title, author, timestamp, article length, keywords]
+  """
+
+  def __init__(self, metadata):
+    self.metadata = metadata
+    self.signature = _signature(metadata)
+    self._postings = {}
+    self._numeric = {}
+    self._title_postings = {}
+    for row, article in enumerate(metadata):
+      for keyword in article[4]:
+        self._postings.setdefault(_fold(keyword), []).append(row)
+      for token in _title_tokens(article[0]):
+        self._title_postings.setdefault(token, []).append(row)
+    self._fields = {'title': self._title_postings, 'keywords': self._postings}
+
+  def numeric(self, field):
+    """ Returns the NumericIndex of a field from NUMERIC_FIELDS, building it the first time
+    """
+    if field not in self._numeric:
+      column = NUMERIC_FIELDS[field]
+      self._numeric[field] = NumericIndex([article[column] for article in self.metadata])
+    return self._numeric[field]
+
+  def is_stale(self, metadata):
+    """ Returns True if the index was not built from the given metadata as it is now
+    """
+    return self.signature != _signature(metadata)
+
+  def rows(self, keyword):
+    """ Returns the positions of rows containing keyword, ignoring case
+    """
+    return self._postings.get(_fold(keyword), [])
+
+  def title_rows(self, word):
+    """ Returns the positions of rows whose title contains word, ignoring case
+    """
+    return self._title_postings.get(_fold(word), [])
+
+  def postings(self, keyword, fields=('keywords',)):
+    """Returns the sorted positions of rows containing keyword, each once
+
+    Args:
+      keyword - word to look up, ignoring case
+      fields - fields to look in, from FIELDS; a row matches if any does
+    """
+    result = []
+    for field in fields:
+      rows = self._fields[field].get(_fold(keyword), [])
+      rows = [row for i, row in enumerate(rows) if i == 0 or rows[i - 1] != row]
+      result = union(result, rows) if result else rows
+    return result
+
+  def lookup(self, keyword):
+    """ Returns [title, author, timestamp, article length] for each row containing keyword
+    """
+    metadata = self.metadata
+    return [metadata[row][:4] for row in self.rows(keyword)]
+
+  def field_lookup(self, word, fields=FIELDS):
+    """ Returns [title, author, timestamp, article length] for each row
+    containing word in any of the given fields, each once
+    """
+    metadata = self.metadata
+    return [metadata[row][:4] for row in self.postings(word, fields)]
+
+_metadata_index = None
+
+def metadata_index():
+  """ Returns the MetadataIndex for article_metadata(), rebuilding it if the
+  metadata has changed since the index was built
+  """
+  global _metadata_index
+  metadata = article_metadata()
+  if _metadata_index is None or _metadata_index.is_stale(metadata):
+    _metadata_index = MetadataIndex(metadata)
+  return _metadata_index
+
+def title_search(word):
+  """ Returns [title, author, timestamp, article length] for each article
+  whose title contains word, ignoring case
+  """
+  return metadata_index().field_lookup(word, ('title',))
+
+def field_search(word, fields=FIELDS):
+  """ Returns [title, author, timestamp, article length] for each article
+  containing word in any of the given fields, by default title or keywords
+  """
+  return metadata_index().field_lookup(word, fields)
\ No newline at end of file
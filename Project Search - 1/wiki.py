@@ -69,10 +69,15 @@ def _metadata_list(info):
   print(metadata)
   return metadata
 
+_article_titles = None
+
 def article_titles():
-  """ Returns a list of article titles
+  """ Returns a list of article titles, worked out on the first call
   """
-  return list(map(lambda article: article.get('title'), ARTICLES))
+  global _article_titles
+  if _article_titles is None:
+    _article_titles = [article.get('title') for article in ARTICLES]
+  return _article_titles
 
 def article_metadata():
   """ Returns a list of article metadata (list of lists)
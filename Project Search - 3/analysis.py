@@ -0,0 +1,139 @@
+from functools import lru_cache
+import re
+
+_WORD = re.compile(r'\w+')
+
+# Common English words longer than two characters, which pass the keyword
+# filter in wiki._find_keywords() and end up listed for most articles
+STOPWORDS = frozenset('''
+about above after again against all also and any are because been before being
+below between both but can could did does doing down during each few for from
+further had has have having her here hers herself him himself his how into its
+itself just more most not now off once only other our ours ourselves out over own
+same she should some such than that the their theirs them themselves then there
+these they this those through too under until very was were what when where which
+while who whom why will with would you your yours yourself yourselves
+'''.split())
+
+def lowercase(token):
+  """ Stage that lowercases a token, the way keywords are stored
+  """
+  return token.lower()
+
+def stopwords(words=STOPWORDS):
+  """ Returns a stage that drops the given words
+  """
+  words = frozenset(words)
+  return lambda token: None if token in words else token
+
+def min_length(length):
+  """ Returns a stage that drops tokens shorter than length characters
+  """
+  return lambda token: token if len(token) >= length else None
+
+# Suffixes light_stem() strips, tried in order, with what replaces them
+_SUFFIXES = (('ians', ''), ('ian', ''), ('ings', ''), ('ing', ''), ('ers', ''), ('ies', 'y'),
+             ('er', ''), ('ed', ''), ('als', ''), ('al', ''), ('s', ''))
+# Suffixes after which a doubled final consonant is undoubled, e.g. running
+_UNDOUBLE = ('ings', 'ing', 'ers', 'er', 'ed')
+# Suffixes only stripped when the stem keeps two vowel-consonant runs, so
+# 'programmer' loses its -er but 'water', 'number' and 'former' do not
+_LONG_STEM = ('ers', 'er')
+# Verb endings, only stripped from stems with a vowel; a short stem ending
+# consonant, vowel, consonant gets its e back, so 'noted' becomes 'note'
+_VERB = ('ings', 'ing', 'ed')
+# Words whose suffix is part of the word, which would otherwise join
+# unrelated ones, like 'news' and 'new'
+_KEEP = frozenset(['news', 'series', 'species', 'united'])
+
+_VOWEL = re.compile(r'[aeiouy]')
+_VOWEL_CONSONANT = re.compile(r'[aeiouy]+[^aeiouy]+')
+_SHORT_END = re.compile(r'[^aeiou][aeiouy][^aeiouwxy]$')
+
+def _measure(stem):
+  """ Returns the number of vowel-consonant runs in stem, 1 for 'wat' and 2
+  for 'program', as Porter's stemmer counts them
+  """
+  return len(_VOWEL_CONSONANT.findall(stem))
+
+def light_stem(word):
+  """ Returns word without its first matching suffix from _SUFFIXES, keeping at
+  least three characters, so 'musician', 'musical' and 'musicians' all become
+  'music' and 'programming' becomes 'program'. Words in _KEEP and stems too
+  short for _LONG_STEM and _VERB suffixes are left alone
+  """
+  if word in _KEEP:
+    return word
+  for suffix, replacement in _SUFFIXES:
+    if not word.endswith(suffix):
+      continue
+    stem = word[:-len(suffix)]
+    if len(stem) < 3 or (suffix == 's' and word.endswith(('ss', 'us', 'is'))):
+      continue
+    if (suffix in _LONG_STEM and _measure(stem) < 2) or (suffix in _VERB and not _VOWEL.search(stem)):
+      continue
+    if suffix in _UNDOUBLE and stem[-1] == stem[-2] and stem[-1] not in 'aeioulsz' and len(stem) > 3:
+      stem = stem[:-1]
+    elif suffix in _VERB and _measure(stem) == 1 and _SHORT_END.search(stem):
+      stem += 'e'
+    return stem + replacement
+  return word
+
+class Stemmer:
+  """Stage reducing tokens to their stem, remembering recent results so a
+  repeated token costs a dictionary lookup
+
+  Args:
+    stem - function returning the stem of a word
+    cache_size - number of distinct tokens to remember stems for
+  """
+
+  def __init__(self, stem=light_stem, cache_size=65536):
+    self._stem = lru_cache(maxsize=cache_size)(stem)
+
+  def __call__(self, token):
+    return self._stem(token)
+
+  def cache_info(self):
+    """ Returns the memo cache's hits, misses and size
+    """
+    return self._stem.cache_info()
+
+class Analyzer:
+  """Chain of stages turning words into index terms
+
+  The same analyzer is applied to keywords when they are indexed and to
+  words when they are searched for, so both sides agree. Each stage takes a
+  token and returns the token to pass on, or None to drop it. The chain is
+  run once per distinct word and the result cached.
+
+  Args:
+    stages - functions applied to each token in order
+    cache_size - number of distinct words to remember terms for
+  """
+
+  def __init__(self, stages, cache_size=65536):
+    self.stages = tuple(stages)
+    self.term = lru_cache(maxsize=cache_size)(self._run)
+
+  def _run(self, token):
+    for stage in self.stages:
+      token = stage(token)
+      if token is None:
+        return None
+    return token
+
+  def analyze(self, text):
+    """ Returns the terms of the words in text, in order, without dropped words
+    """
+    terms = map(self.term, _WORD.findall(text))
+    return [term for term in terms if term is not None]
+
+# Keeps lookups as they have always been: only case is ignored
+DEFAULT_ANALYZER = Analyzer([lowercase])
+
+# Also leaves out STOPWORDS, which shrinks the index and its merges
+ENGLISH_ANALYZER = Analyzer([lowercase, stopwords()])
+
+# Also reduces words to their stem, so variants of a word match each other
+STEMMING_ANALYZER = Analyzer([lowercase, stopwords(), Stemmer()])
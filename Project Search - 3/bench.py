@@ -0,0 +1,383 @@
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+from snapshot import SNAPSHOT_PATH
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+# Each cold start runs in a fresh interpreter that reports its own wall time
+# and peak RSS (ru_maxrss, in kilobytes on Linux)
+_COLD_START = '''
+import resource, time
+start = time.perf_counter()
+{setup}
+import search
+search.search('dog')
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+def _run(code):
+  """ Returns the (seconds, peak RSS in KB) reported by code run in a new interpreter
+  """
+  output = subprocess.check_output([sys.executable, '-c', code], cwd=_here)
+  seconds, rss = output.split()
+  return float(seconds), int(rss)
+
+def cold_start(runs=7):
+  """Compares a single query from a cold interpreter with the old eager imports
+  (every constant and the requests library) against the lazy wiki.py
+
+  Args:
+    runs - number of fresh interpreters to start for each variant
+  """
+  if not os.path.exists(SNAPSHOT_PATH):
+    print('no snapshot, the lazy variant will import constants.py (run snapshot.py first)')
+  variants = [
+    ('eager', 'import constants, requests'),
+    ('lazy', ''),
+  ]
+  for name, setup in variants:
+    results = [_run(_COLD_START.format(setup=setup)) for _ in range(runs)]
+    seconds = statistics.median(result[0] for result in results)
+    rss = statistics.median(result[1] for result in results)
+    print('{:<6} {:8.1f} ms {:8.1f} MB'.format(name, seconds * 1000, rss / 1024))
+
+def _extracts():
+  """ Returns extract-like texts shaped after the real articles: one per
+  article, as long as the article and made of its keywords
+  """
+  from wiki import article_metadata
+  from wiki_tests_helper import fake_extract
+  return [fake_extract(row[4] + ['the', 'and', 'of', 'in'], row[3], seed)
+          for seed, row in enumerate(article_metadata())]
+
+def find_keywords(repeat=5):
+  """Measures keyword extraction throughput in tokens per second over
+  extracts as long as the real articles, old implementation against new
+
+  Args:
+    repeat - number of timed passes over all extracts, the best one is kept
+  """
+  import re
+  from wiki import _find_keywords
+  from wiki_tests_helper import reference_find_keywords
+
+  extracts = _extracts()
+  tokens = sum(len(re.findall(r'\w+', extract)) for extract in extracts)
+  print('{} extracts, {} tokens'.format(len(extracts), tokens))
+  for name, function in [('old', reference_find_keywords), ('new', _find_keywords)]:
+    seconds = min(timeit.repeat(lambda: [function(extract) for extract in extracts], number=1, repeat=repeat))
+    print('{:<6} {:10.0f} tokens/s'.format(name, tokens / seconds))
+
+def parallel_build(articles=2000, length=10000, processes=(1, 2, 4)):
+  """Measures build_from_extracts() throughput with different numbers of
+  worker processes on a synthetic corpus
+
+  Args:
+    articles - number of synthetic articles
+    length - characters per synthetic extract
+    processes - worker process counts to try
+  """
+  import time
+  from index import build_from_extracts
+  from wiki import article_metadata
+  from wiki_tests_helper import fake_articles, fake_extract
+
+  info, extracts = fake_articles(articles)
+  vocabulary = [keyword for row in article_metadata() for keyword in row[4]]
+  for seed, article_id in enumerate(extracts):
+    extracts[article_id] = fake_extract(vocabulary[seed % 500:seed % 500 + 300], length, seed)
+  print('{} articles of {} characters, {} CPUs'.format(articles, length, os.cpu_count()))
+  for count in processes:
+    start = time.perf_counter()
+    build_from_extracts(info, extracts, processes=count)
+    seconds = time.perf_counter() - start
+    print('{:>2} processes {:8.2f} s {:8.0f} articles/s'.format(count, seconds, articles / seconds))
+
+def _scaled_keyword_map(copies):
+  """ Returns the keyword to titles map with every article repeated copies
+  times under new titles, and the titles in document order
+  """
+  from wiki import keyword_to_titles_map, title_to_info_map
+
+  titles = ['{} #{}'.format(title, copy) for copy in range(copies) for title in title_to_info_map()]
+  keyword_to_titles = {keyword: ['{} #{}'.format(title, copy) for copy in range(copies) for title in posting]
+                       for keyword, posting in keyword_to_titles_map().items()}
+  return keyword_to_titles, titles
+
+def analyzer(copies=20, queries=5000):
+  """Reports index size and two-keyword query latency with the default
+  analyzer against the stopword-pruning English one
+
+  Args:
+    copies - times to repeat the articles to scale the corpus up
+    queries - number of two-keyword intersection queries, drawn from keyword
+              occurrences so common words are asked for more often
+  """
+  import random
+  import time
+  from analysis import DEFAULT_ANALYZER, ENGLISH_ANALYZER
+  from index import KeywordIndex, intersect
+
+  keyword_to_titles, titles = _scaled_keyword_map(copies)
+  chooser = random.Random(0)
+  occurrences = [keyword for keyword, posting in keyword_to_titles.items() for _ in range(len(posting) // copies)]
+  workload = [(chooser.choice(occurrences), chooser.choice(occurrences)) for _ in range(queries)]
+  print('{} documents, {} keywords'.format(len(titles), len(keyword_to_titles)))
+  for name, chain in [('default', DEFAULT_ANALYZER), ('english', ENGLISH_ANALYZER)]:
+    index = KeywordIndex(keyword_to_titles, titles, chain)
+    postings = sum(len(posting) for posting in index._postings.values())
+    size = sum(posting.buffer_info()[1] * posting.itemsize for posting in index._postings.values())
+    start = time.perf_counter()
+    for first, second in workload:
+      index.docs.resolve(intersect(index.postings(first), index.postings(second)))
+    seconds = time.perf_counter() - start
+    print('{:<8} {:6} terms {:8} postings {:8.1f} KB {:8.1f} us/query'.format(
+      name, len(index._postings), postings, size / 1024, seconds / queries * 1e6))
+
+def pruning(copies=200, queries=200, k=10):
+  """Compares exhaustive BM25 top-k, which scores every matching document,
+  against MaxScore pruning on a scaled corpus with synthetic term frequencies
+
+  Args:
+    copies - times to repeat the articles to scale the corpus up
+    queries - number of queries of two to four keywords, one of them drawn
+              from keyword occurrences so common words are asked for often
+    k - number of results per query
+  """
+  import random
+  import time
+  from ranking import RankedIndex
+  from wiki import title_to_info_map
+
+  keyword_to_titles, titles = _scaled_keyword_map(copies)
+  chooser = random.Random(0)
+  title_to_info = {}
+  for title in titles:
+    info = title_to_info_map()[title.rsplit(' #', 1)[0]]
+    title_to_info[title] = dict(info, length=max(1, int(info['length'] * chooser.uniform(0.5, 1.5))))
+  # Term frequencies follow a heavy tail, so a few documents stand out per term
+  term_frequencies = {}
+  for keyword, posting in keyword_to_titles.items():
+    for title in posting:
+      term_frequencies.setdefault(title, {})[keyword] = int(chooser.paretovariate(1.2))
+  ranked = RankedIndex(keyword_to_titles, title_to_info, term_frequencies)
+
+  vocabulary = list(keyword_to_titles)
+  occurrences = [keyword for keyword, posting in keyword_to_titles.items() for _ in range(len(posting) // copies)]
+  workload = [[chooser.choice(occurrences)] + chooser.sample(vocabulary, chooser.randint(1, 3)) for _ in range(queries)]
+  print('{} documents, {} keywords, top {}'.format(len(titles), len(keyword_to_titles), k))
+  results = {}
+  for name, pruned in [('exhaustive', False), ('maxscore', True)]:
+    start = time.perf_counter()
+    results[name] = [ranked.search(query, k, pruned=pruned) for query in workload]
+    seconds = time.perf_counter() - start
+    print('{:<10} {:8.1f} us/query'.format(name, seconds / queries * 1e6))
+  print('same results: {}'.format(results['exhaustive'] == results['maxscore']))
+
+def autocomplete(queries=5000, n=10):
+  """Compares top-n completions of typed prefixes from a scan over every
+  keyword of keyword_to_titles_map() against the PrefixIndex
+
+  Args:
+    queries - number of prefixes, each the first one to five characters of a
+              keyword drawn from keyword occurrences
+    n - completions per prefix
+  """
+  import random
+  import time
+  from index import keyword_index
+  from wiki import keyword_to_titles_map
+
+  keyword_to_titles = keyword_to_titles_map()
+  index = keyword_index()
+  chooser = random.Random(0)
+  occurrences = [keyword for keyword, posting in keyword_to_titles.items() for _ in posting]
+  workload = [chooser.choice(occurrences)[:chooser.randint(1, 5)].lower() for _ in range(queries)]
+
+  def scan(prefix):
+    matches = [keyword for keyword in keyword_to_titles if keyword.lower().startswith(prefix)]
+    return sorted(matches, key=lambda keyword: -len(keyword_to_titles[keyword]))[:n]
+
+  print('{} keywords'.format(len(keyword_to_titles)))
+  for name, function in [('scan', scan), ('prefix', lambda prefix: index.complete(prefix, n))]:
+    start = time.perf_counter()
+    for prefix in workload:
+      function(prefix)
+    seconds = time.perf_counter() - start
+    print('{:<6} {:8.1f} us/prefix'.format(name, seconds / queries * 1e6))
+
+def fuzzy(queries=1000):
+  """Compares finding the keywords within the default edit distance of a
+  misspelled keyword by scanning the vocabulary against the FuzzyIndex
+
+  Args:
+    queries - number of misspellings, each a random keyword with one
+              character deleted, inserted or replaced
+  """
+  import random
+  import string
+  import time
+  from index import keyword_index
+  from vocabulary import SHORT_WORD, edit_distance
+
+  index = keyword_index()
+  terms = list(index._postings)
+  chooser = random.Random(0)
+  workload = []
+  for _ in range(queries):
+    word = chooser.choice(terms)
+    position = chooser.randrange(len(word))
+    letter = chooser.choice(string.ascii_lowercase)
+    workload.append(chooser.choice([word[:position] + word[position + 1:], word[:position] + letter + word[position:],
+                                    word[:position] + letter + word[position + 1:]]))
+
+  def scan(word):
+    limit = 1 if len(word) <= SHORT_WORD else 2
+    return [term for term in terms if edit_distance(word, term, limit) <= limit]
+
+  start = time.perf_counter()
+  index.fuzzy()
+  print('{} terms, fuzzy index built in {:.1f} ms'.format(len(terms), (time.perf_counter() - start) * 1000))
+  for name, function in [('scan', scan), ('fuzzy', index.fuzzy().lookup)]:
+    start = time.perf_counter()
+    for word in workload:
+      function(word)
+    seconds = time.perf_counter() - start
+    print('{:<6} {:8.1f} us/query'.format(name, seconds / queries * 1e6))
+
+def wildcard(queries=1000):
+  """Compares matching wildcard patterns against the vocabulary with a
+  regular expression over every keyword against the KGramIndex
+
+  Args:
+    queries - number of patterns, each a prefix, suffix or infix of three to
+              five characters of a random keyword
+  """
+  import random
+  import re
+  import time
+  from index import keyword_index
+
+  index = keyword_index()
+  terms = list(index._postings)
+  chooser = random.Random(0)
+  workload = []
+  for _ in range(queries):
+    word = chooser.choice([term for term in terms if len(term) >= 5])
+    length = chooser.randint(3, 5)
+    start = chooser.randrange(len(word) - length + 1)
+    piece = word[start:start + length]
+    workload.append(chooser.choice([piece + '*', '*' + piece, '*' + piece + '*']))
+
+  def scan(pattern):
+    regex = re.compile('.*'.join(map(re.escape, pattern.split('*'))))
+    return sorted(term for term in terms if regex.fullmatch(term))
+
+  start = time.perf_counter()
+  index.kgrams()
+  print('{} terms, k-gram index built in {:.1f} ms'.format(len(terms), (time.perf_counter() - start) * 1000))
+  for name, function in [('scan', scan), ('kgram', index.expand)]:
+    start = time.perf_counter()
+    for pattern in workload:
+      function(pattern)
+    seconds = time.perf_counter() - start
+    print('{:<6} {:8.1f} us/pattern'.format(name, seconds / queries * 1e6))
+
+def positional(top_terms=(None, 1000, 100), queries=200):
+  """Reports the size of the positional index over extracts as long as the
+  real articles, with positions kept for every term or only the top ones,
+  and how long phrase and NEAR/k queries take
+
+  Args:
+    top_terms - numbers of terms to keep positions for, None for all
+    queries - number of two-word phrases and NEAR/3 queries, each taken from
+              a random place in a random extract
+  """
+  import random
+  import re
+  import time
+  from positional import PositionalIndex
+  from wiki import article_metadata
+
+  extracts = _extracts()
+  titles = [row[0] for row in article_metadata()]
+  words = [re.findall(r'\w+', extract) for extract in extracts]
+  total = sum(map(len, words))
+  chooser = random.Random(0)
+  pairs = []
+  for _ in range(queries):
+    text = chooser.choice([text for text in words if len(text) > 1])
+    start = chooser.randrange(len(text) - 1)
+    pairs.append(text[start:start + 2])
+  print('{} extracts, {} words, {:.1f} KB as 32-bit positions'.format(len(extracts), total, total * 4 / 1024))
+  for count in top_terms:
+    start = time.perf_counter()
+    positions = PositionalIndex(extracts, titles, top_terms=count)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    for first, second in pairs:
+      positions.phrase(first + ' ' + second)
+      positions.near(first, second, 3)
+    seconds = time.perf_counter() - start
+    print('top {:<5} {:8.1f} KB {:8.2f} s build {:8.1f} us/query'.format(
+      str(count or 'all'), positions.size() / 1024, built, seconds / (2 * queries) * 1e6))
+
+def range_filter(copies=200, queries=2000):
+  """Compares filtering a keyword's articles by maximum length with
+  search.article_length(), which looks each title's length up, against
+  narrowing its posting list with a NumericIndex
+
+  Args:
+    copies - times to repeat the articles to scale the corpus up
+    queries - number of (keyword, maximum length) filters, keywords drawn
+              from keyword occurrences
+  """
+  import random
+  import time
+  from index import KeywordIndex, NumericIndex
+  from search import article_length
+  from wiki import title_to_info_map
+
+  keyword_to_titles, titles = _scaled_keyword_map(copies)
+  title_to_info = {title: title_to_info_map()[title.rsplit(' #', 1)[0]] for title in titles}
+  index = KeywordIndex(keyword_to_titles, titles)
+  lengths = NumericIndex([title_to_info[title]['length'] for title in index.docs.titles])
+  chooser = random.Random(0)
+  occurrences = [keyword for keyword, posting in keyword_to_titles.items() for _ in range(len(posting) // copies)]
+  workload = [(chooser.choice(occurrences), chooser.choice([1000, 5000, 20000, 100000])) for _ in range(queries)]
+  # Each variant starts from the keyword's search results in its own form
+  lookups = [(index.lookup(keyword), length) for keyword, length in workload]
+  postings = [(index.postings(keyword), length) for keyword, length in workload]
+  print('{} documents'.format(len(titles)))
+  variants = [
+    ('lookup', lambda: [article_length(length, found, title_to_info) for found, length in lookups]),
+    ('column', lambda: [lengths.filter(posting, high=length) for posting, length in postings]),
+  ]
+  for name, function in variants:
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    print('{:<6} {:8.1f} us/filter'.format(name, seconds / queries * 1e6))
+
+BENCHMARKS = {
+  'cold_start': cold_start,
+  'find_keywords': find_keywords,
+  'parallel_build': parallel_build,
+  'analyzer': analyzer,
+  'pruning': pruning,
+  'autocomplete': autocomplete,
+  'fuzzy': fuzzy,
+  'wildcard': wildcard,
+  'positional': positional,
+  'range_filter': range_filter,
+}
+
+if __name__ == '__main__':
+  names = sys.argv[1:] or list(BENCHMARKS)
+  for name in names:
+    print(name)
+    BENCHMARKS[name]()
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+class ExtractCache:
+  """Persistent cache of article extracts keyed by page ID and revision
+
+  Extracts are stored once per distinct content, named by their SHA-256, and
+  an index maps each (page ID, revision) to the content it was fetched with.
+  The article's timestamp serves as its revision, so an edited article misses
+  the cache and is fetched again. When the stored content grows past
+  max_bytes the least recently used entries are evicted.
+
+  In revalidate mode get() always misses, so every extract is fetched again
+  and put() keeps the stored copy if the content has not changed.
+
+  Call save() to write the index back to disk once done.
+
+  Args:
+    directory - directory holding the cache, created if missing
+    max_bytes - most bytes of extract content to keep
+    revalidate - whether to fetch cached extracts again to check them
+  """
+
+  def __init__(self, directory, max_bytes=256 * 1024 * 1024, revalidate=False):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.revalidate = revalidate
+    self.hits = 0
+    self.misses = 0
+    self.changed = 0
+    self._index_path = os.path.join(directory, 'index.json')
+    os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+    try:
+      with open(self._index_path) as f:
+        self._entries = OrderedDict((key, tuple(entry)) for key, entry in json.load(f))
+    except (OSError, ValueError):
+      self._entries = OrderedDict()
+    # Size of each stored content and the number of entries referring to it
+    self._blob_sizes = {}
+    self._refs = {}
+    for digest, size in self._entries.values():
+      self._blob_sizes[digest] = size
+      self._refs[digest] = self._refs.get(digest, 0) + 1
+    self.size = sum(self._blob_sizes.values())
+    self._evict()
+
+  @staticmethod
+  def _key(page_id, revision):
+    return '{}@{}'.format(page_id, revision)
+
+  def _blob_path(self, digest):
+    return os.path.join(self.directory, 'objects', digest[:2], digest[2:])
+
+  def get(self, page_id, revision):
+    """ Returns the cached extract for the page at the given revision, or None
+    """
+    key = self._key(page_id, revision)
+    entry = self._entries.get(key)
+    if entry is None or self.revalidate:
+      self.misses += 1
+      return None
+    try:
+      with open(self._blob_path(entry[0]), 'rb') as f:
+        extract = f.read().decode('utf-8')
+    except OSError:
+      self._forget(key)
+      self.misses += 1
+      return None
+    self._entries.move_to_end(key)
+    self.hits += 1
+    return extract
+
+  def put(self, page_id, revision, extract):
+    """ Stores the extract for the page at the given revision
+    """
+    key = self._key(page_id, revision)
+    data = extract.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    old = self._entries.pop(key, None)
+    if old is not None and old[0] != digest:
+      self.changed += 1
+    self._entries[key] = (digest, len(data))
+    self._refs[digest] = self._refs.get(digest, 0) + 1
+    if old is not None:
+      self._release(old[0])
+    if digest not in self._blob_sizes:
+      path = self._blob_path(digest)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+      os.replace(path + '.tmp', path)
+      self._blob_sizes[digest] = len(data)
+      self.size += len(data)
+    self._evict()
+
+  def _forget(self, key):
+    digest, _ = self._entries.pop(key)
+    self._release(digest)
+
+  def _release(self, digest):
+    """ Drops one reference to the content with the given digest, deleting it
+    once no entry refers to it
+    """
+    self._refs[digest] -= 1
+    if self._refs[digest]:
+      return
+    del self._refs[digest]
+    self.size -= self._blob_sizes.pop(digest, 0)
+    try:
+      os.remove(self._blob_path(digest))
+    except OSError:
+      pass
+
+  def _evict(self):
+    while self.size > self.max_bytes and self._entries:
+      self._forget(next(iter(self._entries)))
+
+  def save(self):
+    """ Writes the index to disk
+    """
+    with open(self._index_path + '.tmp', 'w') as f:
+      json.dump(list(self._entries.items()), f)
+    os.replace(self._index_path + '.tmp', self._index_path)
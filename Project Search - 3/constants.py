@@ -1,6 +1,3 @@
-import json
-import re
-import requests
 
 ADVANCED = \
   "Any advanced searches?\n" \
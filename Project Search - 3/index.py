@@ -0,0 +1,580 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import heapq
+from analysis import DEFAULT_ANALYZER
+from vocabulary import FuzzyIndex, KGramIndex, PrefixIndex
+from wiki import _article_info, _article_row, _find_keywords, _title_to_info, data_version, title_to_info_map, keyword_to_titles_map
+
+# Posting lists are sorted arrays of unsigned 32-bit document IDs
+POSTING_TYPE = 'I'
+
+def _signature(*mappings):
+  """ Returns a cheap fingerprint of the given mappings, used to notice when one
+  has been replaced or had entries added or removed
+  """
+  return tuple((id(mapping), len(mapping)) for mapping in mappings)
+
+# Intersections switch from a linear merge to galloping search through the
+# longer posting list when it is at least this many times the shorter one
+GALLOP_RATIO = 8
+
+def _gallop(posting, target, low=0):
+  """ Returns the position of the first document ID not below target in a
+  sorted posting list, searching from low in doubling steps, then by bisection
+  """
+  end = len(posting)
+  high = low
+  step = 1
+  while high < end and posting[high] < target:
+    low = high + 1
+    high += step
+    step *= 2
+  return bisect_left(posting, target, low, min(high, end))
+
+def intersect(first, second):
+  """ Returns the sorted document IDs found in both sorted posting lists
+  """
+  result = array(POSTING_TYPE)
+  if len(first) > len(second):
+    first, second = second, first
+  if len(second) >= GALLOP_RATIO * len(first):
+    # Skewed sizes: look each ID of the short list up in the long one
+    position = 0
+    for doc_id in first:
+      position = _gallop(second, doc_id, position)
+      if position == len(second):
+        break
+      if second[position] == doc_id:
+        result.append(doc_id)
+        position += 1
+    return result
+  i, j = 0, 0
+  while i < len(first) and j < len(second):
+    if first[i] < second[j]:
+      i += 1
+    elif first[i] > second[j]:
+      j += 1
+    else:
+      result.append(first[i])
+      i += 1
+      j += 1
+  return result
+
+def union(first, second):
+  """ Returns the sorted document IDs found in either sorted posting list
+  """
+  result = array(POSTING_TYPE)
+  i, j = 0, 0
+  while i < len(first) and j < len(second):
+    if first[i] < second[j]:
+      result.append(first[i])
+      i += 1
+    elif first[i] > second[j]:
+      result.append(second[j])
+      j += 1
+    else:
+      result.append(first[i])
+      i += 1
+      j += 1
+  result.extend(first[i:])
+  result.extend(second[j:])
+  return result
+
+def union_all(postings):
+  """ Returns the sorted document IDs found in any of the sorted posting
+  lists, merging them all at once rather than two at a time
+  """
+  result = array(POSTING_TYPE)
+  last = None
+  for doc_id in heapq.merge(*postings):
+    if doc_id != last:
+      result.append(doc_id)
+      last = doc_id
+  return result
+
+def difference(first, second):
+  """ Returns the sorted document IDs of the first sorted posting list that
+  are not in the second
+  """
+  result = array(POSTING_TYPE)
+  position = 0
+  for doc_id in first:
+    position = _gallop(second, doc_id, position)
+    if position == len(second) or second[position] != doc_id:
+      result.append(doc_id)
+  return result
+
+class DocTable:
+  """Dense two-way mapping between article titles and integer document IDs
+
+  IDs are handed out in the order titles are first added, starting at 0.
+
+  Args:
+    titles - article titles to number up front, in document order
+  """
+
+  def __init__(self, titles=()):
+    self.titles = []
+    self.ids = {}
+    for title in titles:
+      self.add(title)
+
+  def __len__(self):
+    return len(self.titles)
+
+  def add(self, title):
+    """ Returns the document ID for title, numbering it if it is new
+    """
+    doc_id = self.ids.get(title)
+    if doc_id is None:
+      doc_id = len(self.titles)
+      self.ids[title] = doc_id
+      self.titles.append(title)
+    return doc_id
+
+  def resolve(self, doc_ids):
+    """ Returns the list of titles for the given document IDs
+    """
+    titles = self.titles
+    return [titles[doc_id] for doc_id in doc_ids]
+
+class KeywordIndex:
+  """Keyword index over analyzed terms with integer posting lists
+
+  Keywords are turned into terms by the analyzer once when the index is
+  built, and a query is analyzed the same way and looked up with a single
+  hash lookup instead of a scan over every keyword. Keywords the analyzer
+  drops are not indexed. Keywords giving the same term, such as 'music' and
+  'musician' with a stemming analyzer, share one posting list, and
+  surface_forms() tells which keywords a term stands for. A PrefixIndex of
+  the terms is built at the same time for complete().
+
+  Each posting list is a sorted array of document IDs from the index's
+  DocTable; titles are only looked up again when results are returned.
+  Numbering the documents in article order keeps results in the order
+  keyword_to_titles() lists them.
+
+  Args:
+    keyword_to_titles - dictionary mapping keyword to list of article titles
+    titles - all article titles in document order (or a mapping keyed by
+             them), numbered before the titles found in keyword_to_titles
+    analyzer - analysis.Analyzer turning keywords and queries into terms,
+               by default one that only ignores case
+  """
+
+  def __init__(self, keyword_to_titles, titles=(), analyzer=DEFAULT_ANALYZER):
+    self.docs = DocTable(titles)
+    self.analyzer = analyzer
+    self.signature = _signature(keyword_to_titles, titles)
+    self._postings = {}
+    self._surface_forms = {}
+    # The keyword in the most articles for each term, which is what the term
+    # is shown as
+    self._keywords = {}
+    counts = {}
+    for keyword, posting in keyword_to_titles.items():
+      term = analyzer.term(keyword)
+      if term is None:
+        continue
+      doc_ids = array(POSTING_TYPE, sorted(map(self.docs.add, posting)))
+      if term in self._postings:
+        self._postings[term] = union(self._postings[term], doc_ids)
+        self._surface_forms[term].append(keyword)
+        if len(doc_ids) > counts[term]:
+          self._keywords[term] = keyword
+          counts[term] = len(doc_ids)
+      else:
+        self._postings[term] = doc_ids
+        self._surface_forms[term] = [keyword]
+        self._keywords[term] = keyword
+        counts[term] = len(doc_ids)
+    self.prefixes = PrefixIndex({term: len(posting) for term, posting in self._postings.items()})
+    self._fuzzy = None
+    self._kgrams = None
+
+  def is_stale(self, keyword_to_titles, titles=()):
+    """ Returns True if the index was not built from the given arguments as they are now
+    """
+    return self.signature != _signature(keyword_to_titles, titles)
+
+  def postings(self, keyword):
+    """ Returns the sorted document IDs for the term of keyword
+    """
+    term = self.analyzer.term(keyword)
+    if term is None:
+      return array(POSTING_TYPE)
+    return self._postings.get(term, array(POSTING_TYPE))
+
+  def surface_forms(self, keyword):
+    """ Returns the indexed keywords sharing the term of keyword
+    """
+    return self._surface_forms.get(self.analyzer.term(keyword), [])
+
+  def lookup(self, keyword):
+    """ Returns the list of titles for the term of keyword, or an empty list
+    """
+    return self.docs.resolve(self.postings(keyword))
+
+  def complete(self, prefix, n=10):
+    """ Returns up to n keywords for the indexed terms starting with prefix,
+    ignoring case, the ones found in the most articles first; each term is
+    shown as its most common keyword
+    """
+    return [self._keywords[term] for term in self.prefixes.complete(prefix.lower(), n)]
+
+  def fuzzy(self):
+    """ Returns the FuzzyIndex of the terms, building it the first time
+    """
+    if self._fuzzy is None:
+      self._fuzzy = FuzzyIndex({term: len(posting) for term, posting in self._postings.items()})
+    return self._fuzzy
+
+  def similar(self, keyword, max_distance=None):
+    """ Returns the indexed terms within max_distance edits of the term of
+    keyword, closest and most common first; see FuzzyIndex.lookup()
+    """
+    term = self.analyzer.term(keyword)
+    if not term:
+      return []
+    return [match for match, distance in self.fuzzy().lookup(term, max_distance)]
+
+  def fuzzy_postings(self, keyword, max_distance=None):
+    """ Returns the sorted document IDs for the terms within max_distance
+    edits of the term of keyword
+    """
+    return union_all(self._postings[term] for term in self.similar(keyword, max_distance))
+
+  def kgrams(self):
+    """ Returns the KGramIndex of the terms, building it the first time
+    """
+    if self._kgrams is None:
+      self._kgrams = KGramIndex(self._postings)
+    return self._kgrams
+
+  def expand(self, pattern):
+    """ Returns the indexed terms matching pattern, ignoring case, where *
+    stands for any characters
+    """
+    return self.kgrams().match(pattern.lower())
+
+  def wildcard_postings(self, pattern):
+    """ Returns the sorted document IDs for the terms matching pattern
+    """
+    return union_all(self._postings[term] for term in self.expand(pattern))
+
+  def suggest(self, keyword):
+    """ Returns the most common keyword of the closest, most common indexed
+    term to the term of keyword when keyword itself has no articles, or None
+    """
+    term = self.analyzer.term(keyword)
+    if not term or term in self._postings:
+      return None
+    match = self.fuzzy().suggest(term)
+    return None if match is None else self._keywords[match]
+
+class NumericIndex:
+  """Sorted column of one numeric field of every document, for range filters
+
+  Document IDs are kept sorted by value, so the documents with a value in a
+  range are one slice found by two bisections, without looking at any
+  document's value. Each document's rank in that order is kept too, so
+  filter() can tell whether a document of a posting list falls in the slice
+  with one array lookup, like a bitmap of the range, when the posting list
+  is the shorter; otherwise it sorts the slice and intersects the two.
+
+  Args:
+    values - the field's value for each document, indexed by document ID
+  """
+
+  def __init__(self, values):
+    self.order = array(POSTING_TYPE, sorted(range(len(values)), key=values.__getitem__))
+    self.values = array('q', [values[doc_id] for doc_id in self.order])
+    self.ranks = array(POSTING_TYPE, bytes(self.order.itemsize * len(self.order)))
+    for rank, doc_id in enumerate(self.order):
+      self.ranks[doc_id] = rank
+
+  def __len__(self):
+    return len(self.order)
+
+  def _bounds(self, low, high):
+    start = 0 if low is None else bisect_left(self.values, low)
+    end = len(self.values) if high is None else bisect_right(self.values, high)
+    return start, end
+
+  def span(self, low=None, high=None):
+    """ Returns the IDs of the documents with low <= value <= high, in value
+    order; a bound of None leaves that side open
+    """
+    start, end = self._bounds(low, high)
+    return self.order[start:end]
+
+  def doc_ids(self, low=None, high=None):
+    """ Returns the sorted IDs of the documents with low <= value <= high
+    """
+    return array(POSTING_TYPE, sorted(self.span(low, high)))
+
+  def filter(self, posting, low=None, high=None):
+    """ Returns the document IDs of a sorted posting list with low <= value <= high
+    """
+    start, end = self._bounds(low, high)
+    if end - start == len(self.order):
+      return posting
+    if (end - start) * GALLOP_RATIO <= len(posting):
+      return intersect(array(POSTING_TYPE, sorted(self.order[start:end])), posting)
+    ranks = self.ranks
+    return array(POSTING_TYPE, [doc_id for doc_id in posting if start <= ranks[doc_id] < end])
+
+class IndexBuilder:
+  """Builds and maintains keyword_to_titles and title_to_info in one pass
+
+  Articles can be added, removed and updated afterwards without rebuilding
+  from scratch. Each article keeps the document ID it was added with, so the
+  mappings come out exactly as keyword_to_titles() and title_to_info() would
+  return them for the current rows, in the same order. Titles must be unique.
+
+  Args:
+    metadata - 2D list of article metadata containing
+               [title, author, timestamp, article length, keywords]
+  """
+
+  def __init__(self, metadata=()):
+    self._next_id = 0
+    self._ids = {}
+    self._rows = {}
+    self._info = {}
+    self._postings = {}
+    for row in metadata:
+      self.add_article(row)
+
+  def __len__(self):
+    return len(self._rows)
+
+  def __contains__(self, title):
+    return title in self._ids
+
+  def _index_keywords(self, doc_id, keywords):
+    for keyword in keywords:
+      posting = self._postings.get(keyword)
+      if posting is None:
+        posting = self._postings[keyword] = array(POSTING_TYPE)
+      insort(posting, doc_id)
+
+  def _unindex_keywords(self, doc_id, keywords):
+    for keyword in keywords:
+      posting = self._postings[keyword]
+      del posting[bisect_left(posting, doc_id)]
+      if not posting:
+        del self._postings[keyword]
+
+  def add_article(self, row):
+    """ Adds a [title, author, timestamp, article length, keywords] row after all others
+    """
+    title = row[0]
+    if title in self._ids:
+      raise ValueError('article already indexed: ' + title)
+    doc_id = self._next_id
+    self._next_id += 1
+    self._ids[title] = doc_id
+    self._rows[doc_id] = row
+    self._info[title] = _article_info(row)
+    self._index_keywords(doc_id, row[4])
+
+  def remove_article(self, title):
+    """ Removes the article with the given title
+    """
+    doc_id = self._ids.pop(title)
+    row = self._rows.pop(doc_id)
+    del self._info[title]
+    self._unindex_keywords(doc_id, row[4])
+
+  def update_article(self, row):
+    """ Replaces the row of the article with the same title, keeping its position
+    """
+    title = row[0]
+    doc_id = self._ids[title]
+    self._unindex_keywords(doc_id, self._rows[doc_id][4])
+    self._rows[doc_id] = row
+    self._info[title] = _article_info(row)
+    self._index_keywords(doc_id, row[4])
+
+  def metadata(self):
+    """ Returns the current rows as a 2D list of article metadata
+    """
+    return list(self._rows.values())
+
+  def title_to_info(self):
+    """ Returns a mapping of article title to author, timestamp and length
+    """
+    return {title: dict(info) for title, info in self._info.items()}
+
+  def titles(self, keyword):
+    """ Returns the titles of the articles listing keyword, in document order
+    """
+    return [self._rows[doc_id][0] for doc_id in self._postings.get(keyword, ())]
+
+  def keyword_to_titles(self):
+    """ Returns a mapping of keyword to the titles of articles listing it
+    """
+    keyword_to_titles = {}
+    for row in self._rows.values():
+      for keyword in row[4]:
+        if keyword not in keyword_to_titles:
+          keyword_to_titles[keyword] = self.titles(keyword)
+    return keyword_to_titles
+
+# Analyzer used by keyword_index(), and so by search()
+analyzer = DEFAULT_ANALYZER
+
+# positional.PositionalIndex answering phrase and NEAR/k queries in search(),
+# once one has been built from the extracts
+positions = None
+
+_keyword_index = None
+_keyword_index_version = None
+
+def keyword_index():
+  """ Returns the KeywordIndex for keyword_to_titles_map(), rebuilding it if the
+  mapping, title_to_info_map() or analyzer has changed since the index was built.
+  A map replaced or given entries is noticed on its own; edits inside its
+  entries, such as a title removed from a keyword's list, are only noticed
+  after wiki.mark_changed()
+  """
+  global _keyword_index, _keyword_index_version
+  keyword_to_titles = keyword_to_titles_map()
+  title_to_info = title_to_info_map()
+  if (_keyword_index is None or _keyword_index_version != data_version()
+      or _keyword_index.analyzer is not analyzer
+      or _keyword_index.is_stale(keyword_to_titles, title_to_info)):
+    _keyword_index = KeywordIndex(keyword_to_titles, title_to_info, analyzer)
+    _keyword_index_version = data_version()
+  return _keyword_index
+
+_positional_index = None
+_positional_source = None
+_positional_keyword_index = None
+
+def positional_index():
+  """ Returns positions renumbered like keyword_index(), so phrases and NEAR/k
+  combine with its postings, renumbering it again when either changes, or
+  None if no positional index has been built
+  """
+  global _positional_index, _positional_source, _positional_keyword_index
+  if positions is None:
+    return None
+  keywords = keyword_index()
+  if _positional_source is not positions or _positional_keyword_index is not keywords:
+    _positional_index = positions.renumber(keywords.docs)
+    _positional_source = positions
+    _positional_keyword_index = keywords
+  return _positional_index
+
+# Fields of title_to_info_map() with a NumericIndex for range filters
+NUMERIC_FIELDS = ('length', 'timestamp')
+
+_numeric_indexes = {}
+_numeric_keyword_index = None
+
+def numeric_index(field):
+  """ Returns the NumericIndex of a field from NUMERIC_FIELDS over the
+  documents of keyword_index(), rebuilding it along with the keyword index
+  """
+  global _numeric_keyword_index
+  keywords = keyword_index()
+  if _numeric_keyword_index is not keywords:
+    _numeric_indexes.clear()
+    _numeric_keyword_index = keywords
+  if field not in _numeric_indexes:
+    if field not in NUMERIC_FIELDS:
+      raise ValueError('no numeric index for field: ' + field)
+    title_to_info = title_to_info_map()
+    _numeric_indexes[field] = NumericIndex([title_to_info.get(title, {}).get(field, 0)
+                                            for title in keywords.docs.titles])
+  return _numeric_indexes[field]
+
+def autocomplete(prefix, n=10):
+  """ Returns up to n keywords starting with prefix, the ones found in the
+  most articles first
+  """
+  return keyword_index().complete(prefix, n)
+
+def fuzzy_search(keyword, max_distance=None):
+  """ Returns the titles of articles with a keyword within max_distance edits
+  of keyword, by default 1 for short keywords and 2 for longer ones
+  """
+  index = keyword_index()
+  return index.docs.resolve(index.fuzzy_postings(keyword, max_distance))
+
+def wildcard_search(pattern):
+  """ Returns the titles of articles with a keyword matching pattern, such as
+  'mus*', '*ology' or '*photo*'
+  """
+  index = keyword_index()
+  return index.docs.resolve(index.wildcard_postings(pattern))
+
+def did_you_mean(keyword):
+  """ Returns a keyword close to keyword that has articles, if keyword itself
+  has none, or None
+  """
+  return keyword_index().suggest(keyword)
+
+def _map_chunk(chunk):
+  """ Finds the keywords of a chunk of extracts and inverts them
+
+  Args:
+    chunk - (document ID of the first extract, list of extracts)
+
+  Returns (list of keyword lists, dictionary of keyword to document IDs in
+  order), keywords in order of first appearance in the chunk
+  """
+  first_id, extracts = chunk
+  keyword_lists = []
+  postings = {}
+  for doc_id, extract in enumerate(extracts, first_id):
+    keywords = _find_keywords(extract)
+    keyword_lists.append(keywords)
+    for keyword in keywords:
+      postings.setdefault(keyword, []).append(doc_id)
+  return keyword_lists, postings
+
+def build_from_extracts(info, extracts, processes=1, chunk_size=64):
+  """Builds the metadata and both maps from articles whose extracts are local
+
+  Keyword extraction and inversion are split into chunks of articles, run in
+  a pool of worker processes when processes is above one, and merged in chunk
+  order. The result is the same whatever the number of processes, and equal
+  to title_to_info() and keyword_to_titles() of the metadata, key order
+  included.
+
+  Args:
+    info - JSON of information from BigQuery, in the shape of ARTICLES
+    extracts - dictionary mapping article ID to its extract; articles with
+               no extract are left out
+    processes - number of worker processes
+    chunk_size - number of articles each worker handles at a time
+
+  Returns (metadata, title_to_info, keyword_to_titles)
+  """
+  items = [item for item in info if extracts.get(item.get('id')) is not None]
+  texts = [extracts[item.get('id')] for item in items]
+  chunks = [(start, texts[start:start + chunk_size]) for start in range(0, len(texts), chunk_size)]
+  if processes > 1:
+    # Only loaded here, so search() never pays for importing multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+      partials = list(executor.map(_map_chunk, chunks))
+  else:
+    partials = list(map(_map_chunk, chunks))
+
+  metadata = []
+  doc_postings = {}
+  for keyword_lists, postings in partials:
+    for keywords in keyword_lists:
+      metadata.append(_article_row(items[len(metadata)], keywords))
+    for keyword, doc_ids in postings.items():
+      doc_postings.setdefault(keyword, []).extend(doc_ids)
+
+  title_to_info = _title_to_info(metadata)
+  keyword_to_titles = {keyword: [metadata[doc_id][0] for doc_id in doc_ids]
+                       for keyword, doc_ids in doc_postings.items()}
+  return metadata, title_to_info, keyword_to_titles
@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+from wiki import _constant, _find_keywords, _session
+import asyncio
+import time
+
+# Responses worth retrying: rate limited or a temporary server error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class TokenBucket:
+  """Token bucket rate limiter for coroutines
+
+  Args:
+    rate - tokens added per second
+    capacity - most tokens the bucket holds, which is the largest burst
+  """
+
+  def __init__(self, rate, capacity=1):
+    self.rate = rate
+    self.capacity = capacity
+    self.tokens = capacity
+    self._updated = time.monotonic()
+    self._lock = asyncio.Lock()
+
+  async def acquire(self):
+    """ Waits until a token is available and takes it
+    """
+    async with self._lock:
+      while True:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class StageStats:
+  """Throughput counters for one pipeline stage
+
+  Args:
+    name - name of the stage
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.items = 0
+    self.failures = 0
+    self.retries = 0
+    self.started = None
+    self.finished = None
+
+  def record(self):
+    """ Counts one item through the stage
+    """
+    now = time.monotonic()
+    if self.started is None:
+      self.started = now
+    self.finished = now
+    self.items += 1
+
+  def throughput(self):
+    """ Returns items per second between the stage's first and last item
+    """
+    if self.started is None or self.finished == self.started:
+      return float(self.items)
+    return self.items / (self.finished - self.started)
+
+  def __repr__(self):
+    return '{}: {} items, {} failures, {} retries, {:.1f} items/s'.format(
+      self.name, self.items, self.failures, self.retries, self.throughput())
+
+async def _fetch(session, fetcher, api, article_id, bucket, retries, backoff, stats):
+  """ Returns the plain text extract of an article, requested in a thread of
+  fetcher, retrying temporary failures with exponential backoff, or None if
+  it could not be fetched
+  """
+  import requests
+
+  loop = asyncio.get_running_loop()
+  for attempt in range(retries + 1):
+    if bucket is not None:
+      await bucket.acquire()
+    try:
+      resp = await loop.run_in_executor(fetcher, session.get, api.format(article_id))
+    except requests.RequestException:
+      pass
+    else:
+      if resp.status_code == 200:
+        return resp.json().get('query').get('pages')[0].get('extract')
+      if resp.status_code not in RETRY_STATUSES:
+        return None
+    if attempt < retries:
+      stats.retries += 1
+      await asyncio.sleep(backoff * 2 ** attempt)
+  return None
+
+async def ingest(info, api=None, concurrency=8, rate=None, retries=3, backoff=0.5,
+                 queue_size=None, executor=None):
+  """Creates the same list of article metadata as wiki._metadata_list() through
+  a pipeline of fetch, keyword extraction and write stages
+
+  The stages are connected by bounded queues, so fetching waits when
+  extraction falls behind. Requests wait in a thread pool of their own, and
+  keyword extraction runs in executor, so extraction never holds the threads
+  fetches need; pass a ProcessPoolExecutor to spread it over several cores.
+
+  Args:
+    info - JSON of information from BigQuery
+    api - URL of the API with {} in place of the page ID, defaults to WIKI_API
+    concurrency - maximum number of Wikipedia requests in flight
+    rate - maximum requests per second, or None for no limit
+    retries - number of times to retry a request that failed temporarily
+    backoff - seconds to wait before the first retry, doubled for each one after
+    queue_size - capacity of each queue between stages, defaults to twice concurrency
+    executor - concurrent.futures executor for keyword extraction, defaults to
+               a thread pool of concurrency threads used only for it
+
+  Returns (metadata, dictionary of stage name to StageStats)
+  """
+  api = api or _constant('WIKI_API')
+  queue_size = queue_size or 2 * concurrency
+  bucket = TokenBucket(rate) if rate else None
+  loop = asyncio.get_running_loop()
+  stats = {name: StageStats(name) for name in ('fetch', 'extract', 'write')}
+  extractor = executor or ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='extract')
+
+  id_to_item = {}
+  for item in info:
+    id_to_item.setdefault(item.get('id'), item)
+
+  to_fetch = asyncio.Queue(queue_size)
+  to_extract = asyncio.Queue(queue_size)
+  to_write = asyncio.Queue(queue_size)
+  written = []
+
+  async def fetch_stage(session, fetcher):
+    while True:
+      position, article_id, item = await to_fetch.get()
+      try:
+        extract = await _fetch(session, fetcher, api, article_id, bucket, retries, backoff, stats['fetch'])
+      except Exception:
+        extract = None
+      try:
+        if extract is None:
+          stats['fetch'].failures += 1
+        else:
+          stats['fetch'].record()
+          await to_extract.put((position, item, extract))
+      finally:
+        to_fetch.task_done()
+
+  async def extract_stage():
+    while True:
+      position, item, extract = await to_extract.get()
+      try:
+        keywords = await loop.run_in_executor(extractor, _find_keywords, extract)
+      except Exception:
+        keywords = None
+      try:
+        if keywords is None:
+          stats['extract'].failures += 1
+        else:
+          stats['extract'].record()
+          await to_write.put((position, item, keywords))
+      finally:
+        to_extract.task_done()
+
+  async def write_stage():
+    while True:
+      position, item, keywords = await to_write.get()
+      item['keywords'] = keywords
+      written.append((position, item))
+      stats['write'].record()
+      to_write.task_done()
+
+  with _session(concurrency) as session, \
+       ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fetch') as fetcher:
+    workers = [asyncio.create_task(fetch_stage(session, fetcher)) for _ in range(concurrency)]
+    workers += [asyncio.create_task(extract_stage()) for _ in range(concurrency)]
+    workers.append(asyncio.create_task(write_stage()))
+    try:
+      for position, (article_id, item) in enumerate(id_to_item.items()):
+        await to_fetch.put((position, article_id, item))
+      await to_fetch.join()
+      await to_extract.join()
+      await to_write.join()
+    finally:
+      for worker in workers:
+        worker.cancel()
+      await asyncio.gather(*workers, return_exceptions=True)
+      if executor is None:
+        extractor.shutdown()
+
+  written.sort(key=lambda entry: entry[0])
+  return [item for position, item in written], stats
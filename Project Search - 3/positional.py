@@ -0,0 +1,197 @@
+from array import array
+from bisect import bisect_left
+from analysis import DEFAULT_ANALYZER, _WORD
+from index import DocTable, POSTING_TYPE, intersect
+
+def encode_positions(positions):
+  """ Returns sorted word positions as bytes: the gaps between them, each
+  written in as few 7-bit groups as it needs, low group first
+  """
+  data = bytearray()
+  last = 0
+  for position in positions:
+    gap = position - last
+    last = position
+    while gap >= 0x80:
+      data.append(gap & 0x7f | 0x80)
+      gap >>= 7
+    data.append(gap)
+  return bytes(data)
+
+def decode_positions(data):
+  """ Returns the list of word positions encoded by encode_positions()
+  """
+  positions = []
+  last = 0
+  gap = 0
+  shift = 0
+  for byte in data:
+    gap |= (byte & 0x7f) << shift
+    if byte & 0x80:
+      shift += 7
+    else:
+      last += gap
+      positions.append(last)
+      gap = 0
+      shift = 0
+  return positions
+
+class PositionalIndex:
+  """Index of where each term appears in each article's extract, for phrase
+  and proximity queries
+
+  Every word of an extract counts one position, including words the analyzer
+  drops, so 'time travel' only matches the two words side by side. For each
+  term there is a sorted array of document IDs and, in the same order, the
+  term's positions in each document, delta encoded by encode_positions().
+
+  With top_terms set, positions are only kept for that many terms, the ones
+  in the most documents, and the rest keep just their document IDs. A phrase
+  or NEAR/k query with a term that has no positions then matches every
+  document containing all its terms.
+
+  Args:
+    texts - extracts, in document order
+    titles - titles of the articles the extracts belong to, in the same order
+    analyzer - analysis.Analyzer turning words into terms
+    top_terms - number of terms to keep positions for, or None for all
+  """
+
+  def __init__(self, texts, titles, analyzer=DEFAULT_ANALYZER, top_terms=None):
+    self.docs = DocTable(titles)
+    self.analyzer = analyzer
+    self._postings = {}
+    self._positions = {}
+    for doc_id, text in enumerate(texts):
+      found = {}
+      for position, word in enumerate(_WORD.findall(text)):
+        term = analyzer.term(word)
+        if term is not None:
+          found.setdefault(term, []).append(position)
+      for term, positions in found.items():
+        if term not in self._postings:
+          self._postings[term] = array(POSTING_TYPE)
+          self._positions[term] = []
+        self._postings[term].append(doc_id)
+        self._positions[term].append(encode_positions(positions))
+    if top_terms is not None:
+      kept = sorted(self._postings, key=lambda term: (-len(self._postings[term]), term))[:top_terms]
+      self._positions = {term: self._positions[term] for term in kept}
+
+  @classmethod
+  def from_extracts(cls, info, extracts, analyzer=DEFAULT_ANALYZER, top_terms=None):
+    """Builds a PositionalIndex from fetched extracts, numbering the articles
+    as index.build_from_extracts() does
+
+    Args:
+      info - JSON of information from BigQuery, in the shape of ARTICLES
+      extracts - dictionary mapping article ID to its extract; articles with
+                 no extract are left out
+      analyzer - analysis.Analyzer turning words into terms
+      top_terms - number of terms to keep positions for, or None for all
+    """
+    items = [item for item in info if extracts.get(item.get('id')) is not None]
+    return cls((extracts[item.get('id')] for item in items), [item.get('title') for item in items],
+               analyzer, top_terms)
+
+  def renumber(self, docs):
+    """ Returns a copy of the index numbering its articles as the DocTable docs
+    does, so its results combine with postings over docs; articles docs does
+    not have are left out
+    """
+    ids = [docs.ids.get(title) for title in self.docs.titles]
+    renumbered = PositionalIndex((), (), self.analyzer)
+    renumbered.docs = docs
+    for term, posting in self._postings.items():
+      # Keeps each document's positions next to its new ID as the IDs are sorted
+      pairs = sorted((ids[doc_id], i) for i, doc_id in enumerate(posting) if ids[doc_id] is not None)
+      renumbered._postings[term] = array(POSTING_TYPE, [doc_id for doc_id, i in pairs])
+      if term in self._positions:
+        renumbered._positions[term] = [self._positions[term][i] for doc_id, i in pairs]
+    return renumbered
+
+  def size(self):
+    """ Returns the number of bytes of encoded positions
+    """
+    return sum(len(data) for lists in self._positions.values() for data in lists)
+
+  def postings(self, word):
+    """ Returns the sorted document IDs for the term of word
+    """
+    return self._postings.get(self.analyzer.term(word), array(POSTING_TYPE))
+
+  def positions(self, word, doc_id):
+    """ Returns the positions of the term of word in a document, an empty list
+    if it is not there, or None if its positions were not kept
+    """
+    term = self.analyzer.term(word)
+    posting = self._postings.get(term, ())
+    i = bisect_left(posting, doc_id)
+    if i == len(posting) or posting[i] != doc_id:
+      return []
+    if term not in self._positions:
+      return None
+    return decode_positions(self._positions[term][i])
+
+  def _candidates(self, words):
+    """ Returns the sorted document IDs containing every word
+    """
+    lists = sorted(map(self.postings, words), key=len)
+    result = lists[0]
+    for posting in lists[1:]:
+      if not result:
+        break
+      result = intersect(result, posting)
+    return result
+
+  def phrase(self, text):
+    """ Returns the sorted document IDs whose extract has the words of text
+    next to each other, in order
+    """
+    words = [(offset, word) for offset, word in enumerate(_WORD.findall(text))
+             if self.analyzer.term(word) is not None]
+    if not words:
+      return array(POSTING_TYPE)
+    result = array(POSTING_TYPE)
+    for doc_id in self._candidates([word for offset, word in words]):
+      starts = None
+      for offset, word in words:
+        positions = self.positions(word, doc_id)
+        if positions is None:
+          continue
+        shifted = {position - offset for position in positions}
+        starts = shifted if starts is None else starts & shifted
+        if not starts:
+          break
+      if starts is None or starts:
+        result.append(doc_id)
+    return result
+
+  def near(self, first, second, distance):
+    """ Returns the sorted document IDs whose extract has the two words at
+    most distance words apart, in either order
+    """
+    result = array(POSTING_TYPE)
+    same = self.analyzer.term(first) == self.analyzer.term(second)
+    for doc_id in self._candidates([first, second]):
+      left = self.positions(first, doc_id)
+      right = self.positions(second, doc_id)
+      if left is None or right is None:
+        result.append(doc_id)
+        continue
+      if same:
+        # Two different occurrences of the same term
+        if any(following - position <= distance for position, following in zip(left, left[1:])):
+          result.append(doc_id)
+        continue
+      # Walk both sorted lists, always comparing the closest pair so far
+      i, j = 0, 0
+      while i < len(left) and j < len(right):
+        if abs(left[i] - right[j]) <= distance:
+          result.append(doc_id)
+          break
+        if left[i] < right[j]:
+          i += 1
+        else:
+          j += 1
+    return result
@@ -0,0 +1,245 @@
+from array import array
+from index import POSTING_TYPE, difference, intersect, keyword_index, numeric_index, positional_index, union
+from datetime import MAXYEAR, MINYEAR
+import calendar
+import re
+
+# Operators are only recognized in upper case, so 'and', 'or' and 'not' can
+# still be searched for as keywords
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# Joins two words that must be at most k words apart, as in rock NEAR/3 roll
+_NEAR = re.compile(r'NEAR/(\d+)$')
+
+# Range filters on numeric fields, as in length<=5000 or timestamp>1200000000
+_COMPARISON = re.compile(r'(length|timestamp)(<=|>=|<|>|=)(\d+)$')
+# Timestamp filters by year, as in after:2008 or before:2008
+_YEAR = re.compile(r'(after|before):(\d{4})$')
+
+_TOKEN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+
+def is_query(text):
+  """ Returns True if text uses boolean operators, parentheses, * wildcards,
+  quoted phrases, NEAR/k or range filters rather than being a single keyword
+  """
+  tokens = _TOKEN.findall(text)
+  # A lone operator has nothing to combine, so it is searched for as a keyword
+  if len(tokens) == 1 and tokens[0] in OPERATORS:
+    return False
+  return any(token in OPERATORS or token in '()' or '*' in token or token[0] == '"' or _NEAR.match(token)
+             or _range(token) for token in tokens)
+
+def _range(token):
+  """ Returns the ('range', field, low, high) node for a range filter token,
+  with inclusive bounds and None for an open side, or None for other tokens
+  """
+  comparison = _COMPARISON.match(token)
+  if comparison:
+    field, operator, value = comparison.groups()
+    value = int(value)
+    low, high = {'<=': (None, value), '<': (None, value - 1), '>=': (value, None),
+                 '>': (value + 1, None), '=': (value, value)}[operator]
+    return ('range', field, low, high)
+  year = _YEAR.match(token)
+  if year:
+    # after:2008 starts with 2009, before:2008 ends with 2007, both in UTC
+    which, value = year.groups()
+    boundary = int(value) + 1 if which == 'after' else int(value)
+    if not MINYEAR <= boundary <= MAXYEAR:
+      # calendar.timegm() has no timestamp for it, so it is left as a word
+      return None
+    start = calendar.timegm((boundary, 1, 1, 0, 0, 0))
+    return ('range', 'timestamp', start, None) if which == 'after' else ('range', 'timestamp', None, start - 1)
+  return None
+
+def parse(text):
+  """Parses a boolean query into a tree of tuples
+
+  NOT binds tightest, then AND, then OR. Words next to each other without an
+  operator are ANDed, and 'a NOT b' means a AND NOT b, so
+  'music AND (rock OR jazz) NOT pop' parses to
+  ('and', [('term', 'music'), ('or', [('term', 'rock'), ('term', 'jazz')]), ('not', ('term', 'pop'))]).
+
+  '"time travel"' parses to ('phrase', 'time travel') and 'rock NEAR/3 roll'
+  to ('near', 'rock', 'roll', 3); both need a positional index to evaluate.
+
+  'length<=5000' parses to ('range', 'length', None, 5000) and 'after:2008'
+  to ('range', 'timestamp', 1230768000, None), filters that combine with
+  words like any other operand, as in 'music length<=5000 after:2008'.
+
+  Args:
+    text - query string
+
+  Raises ValueError if the query is empty or malformed
+  """
+  tokens = _TOKEN.findall(text)
+  position = 0
+
+  def peek():
+    return tokens[position] if position < len(tokens) else None
+
+  def take():
+    nonlocal position
+    token = peek()
+    if token is None:
+      raise ValueError('unexpected end of query: ' + text)
+    position += 1
+    return token
+
+  def or_expression():
+    operands = [and_expression()]
+    while peek() == 'OR':
+      take()
+      operands.append(and_expression())
+    return operands[0] if len(operands) == 1 else ('or', operands)
+
+  def and_expression():
+    operands = [unary()]
+    while peek() not in (None, 'OR', ')'):
+      if peek() == 'AND':
+        take()
+      operands.append(unary())
+    return operands[0] if len(operands) == 1 else ('and', operands)
+
+  def unary():
+    token = take()
+    if token == 'NOT':
+      return ('not', unary())
+    if token == '(':
+      node = or_expression()
+      if take() != ')':
+        raise ValueError('expected ) in query: ' + text)
+      return node
+    if token[0] == '"':
+      if len(token) < 2 or token[-1] != '"':
+        raise ValueError('unclosed " in query: ' + text)
+      return ('phrase', token[1:-1])
+    node = _range(token)
+    if node:
+      return node
+    if token in OPERATORS or token == ')' or _NEAR.match(token):
+      raise ValueError('unexpected {} in query: {}'.format(token, text))
+    near = _NEAR.match(peek() or '')
+    if near:
+      take()
+      other = take()
+      if other in OPERATORS or other in '()' or other[0] == '"' or _NEAR.match(other):
+        raise ValueError('expected a word after {} in query: {}'.format(near.group(0), text))
+      return ('near', token, other, int(near.group(1)))
+    return ('term', token)
+
+  node = or_expression()
+  if peek() is not None:
+    raise ValueError('unexpected {} in query: {}'.format(peek(), text))
+  return node
+
+def uses_positions(node):
+  """ Returns True if a parsed query has phrases or NEAR/k in it
+  """
+  kind = node[0]
+  if kind in ('phrase', 'near'):
+    return True
+  if kind == 'not':
+    return uses_positions(node[1])
+  if kind in ('and', 'or'):
+    return any(map(uses_positions, node[1]))
+  return False
+
+def evaluate(node, postings, universe, positions=None, numeric=None):
+  """Returns the sorted document IDs matching a parsed query
+
+  AND operands are intersected smallest first, stopping once the result is
+  empty, and negated operands are subtracted from the result afterwards, so
+  the whole collection is only needed for a query that is negated as a whole.
+
+  Args:
+    node - query tree from parse()
+    postings - function returning the sorted document IDs of a keyword
+    universe - function returning the sorted IDs of all documents
+    positions - positional.PositionalIndex over the same document IDs for
+                phrases and NEAR/k; without one they raise ValueError
+    numeric - function returning the index.NumericIndex of a field over the
+              same document IDs for range filters; without one they raise
+              ValueError
+  """
+  kind = node[0]
+  if kind == 'term':
+    return postings(node[1])
+  if kind in ('phrase', 'near'):
+    if positions is None:
+      raise ValueError('phrase and NEAR queries need a positional index')
+    return positions.phrase(node[1]) if kind == 'phrase' else positions.near(*node[1:])
+  if kind == 'range':
+    if numeric is None:
+      raise ValueError('range filters need numeric indexes')
+    return numeric(node[1]).doc_ids(*node[2:])
+  if kind == 'not':
+    return difference(universe(), evaluate(node[1], postings, universe, positions, numeric))
+  if kind == 'or':
+    result = evaluate(node[1][0], postings, universe, positions, numeric)
+    for operand in node[1][1:]:
+      result = union(result, evaluate(operand, postings, universe, positions, numeric))
+    return result
+
+  # Range filters narrow the other operands' result down rather than being
+  # intersected with it
+  included = [operand for operand in node[1] if operand[0] not in ('not', 'range')]
+  excluded = [operand[1] for operand in node[1] if operand[0] == 'not']
+  filters = [operand for operand in node[1] if operand[0] == 'range']
+  if not included and filters:
+    included.append(filters.pop())
+  if included:
+    lists = sorted((evaluate(operand, postings, universe, positions, numeric) for operand in included), key=len)
+    result = lists[0]
+    for posting in lists[1:]:
+      if not result:
+        break
+      result = intersect(result, posting)
+  else:
+    result = universe()
+  for operand in filters:
+    if not result:
+      break
+    if numeric is None:
+      raise ValueError('range filters need numeric indexes')
+    result = numeric(operand[1]).filter(result, *operand[2:])
+  for operand in excluded:
+    if not result:
+      break
+    result = difference(result, evaluate(operand, postings, universe, positions, numeric))
+  return result
+
+def boolean_postings(text):
+  """ Returns the sorted document IDs of keyword_index() matching a boolean
+  query of keywords, wildcard patterns, range filters, phrases and NEAR/k.
+  Phrases and NEAR/k are answered by index.positions, the PositionalIndex
+  built from the extracts, and everything else by the keyword and numeric
+  indexes. Raises ValueError if the query is malformed or needs a positional
+  index that has not been built
+  """
+  node = parse(text)
+  positions = None
+  if uses_positions(node):
+    positions = positional_index()
+    if positions is None:
+      raise ValueError('phrase and NEAR queries need a positional index')
+  keywords = keyword_index()
+  postings = lambda word: keywords.wildcard_postings(word) if '*' in word else keywords.postings(word)
+  universe = lambda: array(POSTING_TYPE, range(len(keywords.docs)))
+  return evaluate(node, postings, universe, positions, numeric_index)
+
+def search_postings(text):
+  """ Returns the sorted document IDs of keyword_index() for the articles
+  search() lists for text, as a boolean query or a single keyword. Raises
+  ValueError if the query is malformed
+  """
+  if is_query(text):
+    return boolean_postings(text)
+  return keyword_index().postings(text)
+
+def boolean_search(text):
+  """ Returns the titles of articles matching a boolean query, in the order
+  search() lists them; see boolean_postings(). Raises ValueError if the
+  query is malformed or needs a positional index that has not been built
+  """
+  return keyword_index().docs.resolve(boolean_postings(text))
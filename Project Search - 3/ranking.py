@@ -0,0 +1,245 @@
+from array import array
+from bisect import bisect_left
+from analysis import DEFAULT_ANALYZER
+from index import DocTable, POSTING_TYPE, union
+import index
+from wiki import _article_row, _find_keyword_counts, _keyword_to_titles, _title_to_info, data_version, title_to_info_map, keyword_to_titles_map
+import heapq
+import math
+
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# Term frequencies are stored as unsigned 32-bit counts next to the postings
+FREQUENCY_TYPE = 'I'
+
+class RankedIndex:
+  """Keyword index that keeps term frequencies and document lengths for BM25
+
+  Each term has a sorted array of document IDs and a parallel array of how
+  often the term appears in each document. Keywords sharing a term add their
+  counts together. Document lengths, in characters, are kept in one array
+  indexed by document ID.
+
+  Args:
+    keyword_to_titles - dictionary mapping keyword to list of article titles
+    title_to_info - dictionary mapping article title to author, timestamp
+                    and length, in document order
+    term_frequencies - dictionary mapping article title to a dictionary of
+                       keyword to count; keywords without a count count once
+    analyzer - analysis.Analyzer turning keywords and queries into terms
+  """
+
+  def __init__(self, keyword_to_titles, title_to_info, term_frequencies=None, analyzer=DEFAULT_ANALYZER):
+    self.docs = DocTable(title_to_info)
+    self.analyzer = analyzer
+    term_frequencies = term_frequencies or {}
+
+    counts = {}
+    for keyword, titles in keyword_to_titles.items():
+      term = analyzer.term(keyword)
+      if term is None:
+        continue
+      term_counts = counts.setdefault(term, {})
+      for title in titles:
+        doc_id = self.docs.add(title)
+        count = term_frequencies.get(title, {}).get(keyword, 1)
+        term_counts[doc_id] = term_counts.get(doc_id, 0) + count
+
+    self._postings = {}
+    self._frequencies = {}
+    for term, term_counts in counts.items():
+      # Keywords whose title lists were emptied have nothing to rank
+      if not term_counts:
+        continue
+      doc_ids = sorted(term_counts)
+      self._postings[term] = array(POSTING_TYPE, doc_ids)
+      self._frequencies[term] = array(FREQUENCY_TYPE, [term_counts[doc_id] for doc_id in doc_ids])
+
+    self.lengths = array('I', [title_to_info.get(title, {}).get('length', 1) for title in self.docs.titles])
+    # Falls back to 1 when there are no documents or all have length 0
+    self.average_length = (sum(self.lengths) / len(self.lengths) if self.lengths else 0) or 1
+    # Length normalization part of each document's BM25 weight denominator
+    self._norms = array('d', [K1 * (1 - B + B * length / self.average_length) for length in self.lengths])
+
+    # Highest score each term gives any document, for pruning in top_k()
+    self._max_scores = {}
+    for term, doc_ids in self._postings.items():
+      weights = map(self._weight, self._frequencies[term], doc_ids)
+      self._max_scores[term] = self.idf(term) * max(weights)
+
+  @classmethod
+  def from_extracts(cls, info, extracts, analyzer=DEFAULT_ANALYZER):
+    """Builds a RankedIndex from fetched extracts, with keywords found and
+    counted in them, numbering the articles as index.build_from_extracts() does
+
+    Args:
+      info - JSON of information from BigQuery, in the shape of ARTICLES
+      extracts - dictionary mapping article ID to its extract; articles with
+                 no extract are left out
+      analyzer - analysis.Analyzer turning keywords and queries into terms
+    """
+    metadata = []
+    term_frequencies = {}
+    for item in info:
+      extract = extracts.get(item.get('id'))
+      if extract is not None:
+        # One count per extract gives both the keywords and their frequencies
+        counts = _find_keyword_counts(extract)
+        metadata.append(_article_row(item, list(counts)))
+        term_frequencies[item.get('title')] = counts
+    return cls(_keyword_to_titles(metadata), _title_to_info(metadata), term_frequencies, analyzer)
+
+  def idf(self, term):
+    """ Returns the BM25 inverse document frequency of an analyzed term
+    """
+    frequency = len(self._postings.get(term, ()))
+    return math.log(1 + (len(self.docs) - frequency + 0.5) / (frequency + 0.5))
+
+  def _weight(self, frequency, doc_id):
+    """ Returns the BM25 term frequency weight of a term appearing frequency
+    times in a document
+    """
+    return frequency * (K1 + 1) / (frequency + self._norms[doc_id])
+
+  def _terms(self, query):
+    """ Returns the distinct terms of a query string or list of keywords
+    """
+    words = self.analyzer.analyze(query) if isinstance(query, str) else map(self.analyzer.term, query)
+    return [term for term in dict.fromkeys(words) if term in self._postings]
+
+  def scores(self, query):
+    """ Returns a dictionary of document ID to BM25 score for documents
+    matching any term of the query
+    """
+    scores = {}
+    for term in self._terms(query):
+      idf = self.idf(term)
+      for doc_id, frequency in zip(self._postings[term], self._frequencies[term]):
+        scores[doc_id] = scores.get(doc_id, 0.0) + idf * self._weight(frequency, doc_id)
+    return scores
+
+  def top_k(self, query, k=10):
+    """Returns the top k (document ID, score) pairs for a query, best first,
+    skipping documents that cannot make the top k (MaxScore)
+
+    Terms are taken from the lowest upper-bound score up. Once the k-th best
+    score beats the summed upper bounds of the lowest terms, those terms can
+    no longer bring in a document by themselves. Only the other, essential
+    terms' postings are walked, and the rest are searched for a candidate
+    only while it could still make the top k. The result is the same as
+    ranking every matching document.
+
+    Args:
+      query - string of keywords, or list of keywords
+      k - number of results
+    """
+    order = self._terms(query)
+    if k <= 0 or not order:
+      return []
+    terms = sorted(order, key=self._max_scores.get)
+    count = len(terms)
+    # Upper bounds are nudged up so floating point rounding never prunes a match
+    bounds = [self._max_scores[term] * (1 + 1e-9) for term in terms]
+    prefix = [sum(bounds[:i + 1]) for i in range(count)]
+    postings = [self._postings[term] for term in terms]
+    frequencies = [self._frequencies[term] for term in terms]
+    ends = [len(posting) for posting in postings]
+    idfs = [self.idf(term) for term in terms]
+    # Scores are summed in query order, like scores() does, so they match it exactly
+    query_position = [order.index(term) for term in terms]
+    norms = self._norms
+    cursors = [0] * count
+    top = []
+    threshold = 0.0
+    essential = 0
+
+    while True:
+      candidate = None
+      for i in range(essential, count):
+        if cursors[i] < ends[i]:
+          doc_id = postings[i][cursors[i]]
+          if candidate is None or doc_id < candidate:
+            candidate = doc_id
+      if candidate is None:
+        break
+
+      parts = [0.0] * count
+      for i in range(essential, count):
+        cursor = cursors[i]
+        if cursor < ends[i] and postings[i][cursor] == candidate:
+          frequency = frequencies[i][cursor]
+          parts[query_position[i]] = idfs[i] * (frequency * (K1 + 1) / (frequency + norms[candidate]))
+          cursors[i] = cursor + 1
+
+      # Look the candidate up in the non-essential terms while it can still make it
+      possible = sum(parts) + (prefix[essential - 1] if essential else 0.0)
+      for i in range(essential - 1, -1, -1):
+        if possible < threshold and len(top) == k:
+          break
+        cursor = cursors[i] = bisect_left(postings[i], candidate, cursors[i])
+        possible -= bounds[i]
+        if cursor < ends[i] and postings[i][cursor] == candidate:
+          frequency = frequencies[i][cursor]
+          part = parts[query_position[i]] = idfs[i] * (frequency * (K1 + 1) / (frequency + norms[candidate]))
+          possible += part
+      else:
+        entry = (sum(parts), -candidate)
+        if len(top) < k:
+          heapq.heappush(top, entry)
+        elif entry > top[0]:
+          heapq.heapreplace(top, entry)
+        else:
+          continue
+        if len(top) == k:
+          threshold = top[0][0]
+          while essential < count and prefix[essential] < threshold:
+            essential += 1
+
+    return [(-doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+  def search(self, query, k=10, ranked=True, pruned=True):
+    """Returns the titles of the top k articles for a query
+
+    Args:
+      query - string of keywords, or list of keywords
+      k - most titles to return
+      ranked - whether to order by BM25 score; if False, matching articles
+               come in document order, as search() lists them
+      pruned - whether to skip documents that cannot make the top k with
+               top_k() rather than score every match
+    """
+    if not ranked:
+      doc_ids = array(POSTING_TYPE)
+      for term in self._terms(query):
+        doc_ids = union(doc_ids, self._postings[term])
+      return self.docs.resolve(doc_ids[:k])
+    if pruned:
+      return self.docs.resolve(doc_id for doc_id, score in self.top_k(query, k))
+    # nlargest keeps a heap of only k entries; ties go to the earlier document
+    top = heapq.nlargest(k, self.scores(query).items(), key=lambda entry: (entry[1], -entry[0]))
+    return self.docs.resolve(doc_id for doc_id, score in top)
+
+_ranked_index = None
+_ranked_index_key = None
+
+def ranked_index():
+  """ Returns the RankedIndex for keyword_to_titles_map() and title_to_info_map(),
+  rebuilding it when they change
+  """
+  global _ranked_index, _ranked_index_key
+  keyword_to_titles = keyword_to_titles_map()
+  title_to_info = title_to_info_map()
+  key = (id(keyword_to_titles), len(keyword_to_titles), id(title_to_info), len(title_to_info),
+         data_version(), index.analyzer)
+  if _ranked_index is None or _ranked_index_key != key:
+    _ranked_index = RankedIndex(keyword_to_titles, title_to_info, analyzer=index.analyzer)
+    _ranked_index_key = key
+  return _ranked_index
+
+def ranked_search(query, k=10, ranked=True):
+  """ Returns the titles of the top k articles for a query by BM25, or the
+  first k matches in document order if ranked is False
+  """
+  return ranked_index().search(query, k, ranked)
@@ -1,4 +1,6 @@
-from wiki import article_metadata, ask_search, ask_advanced_search, title_to_info_map, keyword_to_titles_map
+from wiki import article_metadata, ask_search, ask_advanced_search, title_to_info_map
+from index import did_you_mean, keyword_index, numeric_index
+from query import boolean_search, is_query, search_postings
 
 # FOR ALL OF THESE FUNCTIONS, READ THE FULL INSTRUCTIONS.
 
@@ -61,7 +63,7 @@ def keyword_to_titles(metadata):
             if keywords not in dict:
                 dict[keywords] = [articles[0]]
             else:
-                dict[keywords] = dict[keywords] + [articles[0]]
+                dict[keywords].append(articles[0])
     return dict
     
 
@@ -81,11 +83,14 @@ def keyword_to_titles(metadata):
 # TODO Write code for #3 here
 
 def search(keyword):
-    key = keyword_to_titles_map()
-    for keywords in key:
-        if keywords.lower() == keyword.lower():
-            return key[keywords]
-    return []        
+    # Keywords combined with AND, OR, NOT and parentheses, * wildcards, quoted
+    # phrases, NEAR/k and range filters as in length<=5000 are a query
+    if is_query(keyword):
+        try:
+            return boolean_search(keyword)
+        except ValueError:
+            return []
+    return keyword_index().lookup(keyword)
             
   
 '''
@@ -201,7 +206,11 @@ def multiple_keywords(keyword, titles):
 # Prints out articles based on searched keyword and advanced options
 def display_result():
     # Stores list of articles returned from searching user's keyword
-    articles = search(ask_search())
+    keyword = ask_search()
+    articles = search(keyword)
+
+    # Offer a close keyword when a single keyword found nothing, e.g. a typo
+    suggestion = None if articles or is_query(keyword) else did_you_mean(keyword)
 
     # advanced stores user's chosen advanced option (1-7)
     # value stores user's response in being asked the advanced option
@@ -215,8 +224,10 @@ def display_result():
     if advanced == 2:
         # value stores max length of articles
         # Update articles to contain only ones not exceeding the maximum length
-        # TODO uncomment following line after writing the function and delete pass
-        articles = article_length(value, articles, title_to_info_map())
+        # The length index narrows the keyword's postings down directly, giving
+        # the same articles as article_length(value, articles, title_to_info_map())
+        doc_ids = numeric_index('length').filter(search_postings(keyword), high=value) if articles else []
+        articles = keyword_index().docs.resolve(doc_ids)
        
     elif advanced == 3:
         # Update article metadata to only contain titles and timestamps
@@ -240,6 +251,8 @@ def display_result():
 
     if not articles:
         print("No articles found")
+        if suggestion:
+            print("Did you mean: " + suggestion + "?")
     else:
         print("Here are your articles: " + str(articles))
 
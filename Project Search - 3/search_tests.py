@@ -1,8 +1,23 @@
 from search import title_to_info, keyword_to_titles, search, article_info, article_length, title_timestamp, favorite_author, multiple_keywords, display_result
 from search_tests_helper import print_basic, print_advanced, print_advanced_option, get_print
-from wiki import article_metadata, title_to_info_map, keyword_to_titles_map
+from wiki import article_metadata, mark_changed, title_to_info_map, keyword_to_titles_map, ADVANCED_TO_QUESTION
+from index import IndexBuilder, KeywordIndex, NumericIndex, autocomplete, build_from_extracts, did_you_mean, difference, fuzzy_search, intersect, keyword_index, numeric_index, union, union_all, wildcard_search
+from query import evaluate, is_query, parse
+from positional import PositionalIndex, decode_positions, encode_positions
+from vocabulary import FuzzyIndex, KGramIndex, PrefixIndex, edit_distance
+from wiki_tests_helper import fake_articles, fake_extract
+from analysis import Analyzer, DEFAULT_ANALYZER, ENGLISH_ANALYZER, STEMMING_ANALYZER, Stemmer, light_stem, lowercase, min_length, stopwords
+import index
+from ranking import RankedIndex, ranked_index, ranked_search
+from snapshot import SNAPSHOT_MAGIC, load_constants, read_snapshot, write_snapshot
 from unittest.mock import patch
 from copy import deepcopy
+from array import array
+import os
+import re
+import subprocess
+import sys
+import tempfile
 
 # List of all available article titles for this search engine
 # The benefit of using this is faster code - these functions will execute
@@ -300,6 +315,505 @@ def test_keyword_to_titles():
     assert keyword_to_titles(deepcopy(fake_metadata_3)) == expected
 
 
+def test_keyword_index():
+    ''' Tests for the case-folded keyword index behind search(). '''
+    index = KeywordIndex({'Dog': ['a'], 'dog': ['b'], 'cat': ['c']})
+    assert index.lookup('DOG') == ['a', 'b']
+    assert index.lookup('Cat') == ['c']
+    assert index.lookup('bird') == []
+
+    # Adding a keyword to the underlying map rebuilds the index on next search
+    KEYWORD_TO_TITLES['zzyzx'] = ['Guide dog']
+    try:
+        assert search('ZZYZX') == ['Guide dog']
+    finally:
+        del KEYWORD_TO_TITLES['zzyzx']
+    assert search('zzyzx') == []
+
+    # Edits inside an entry are only seen once they are marked
+    KEYWORD_TO_TITLES['dog'].remove('Guide dog')
+    try:
+        assert 'Guide dog' in search('dog')
+        mark_changed()
+        assert 'Guide dog' not in search('dog')
+    finally:
+        KEYWORD_TO_TITLES['dog'].insert(3, 'Guide dog')
+        mark_changed()
+    assert search('dog') == ['Black dog (ghost)', 'Mexican dog-faced bat', 'Dalmatian (dog)', 'Guide dog', 'Sun dog']
+
+
+def test_keyword_index_postings():
+    ''' Tests for integer posting lists and their merges. '''
+    index = KeywordIndex({'dog': ['b', 'a'], 'cat': ['c', 'a']}, ['a', 'b', 'c'])
+    assert index.postings('dog').typecode == 'I'
+    assert list(index.postings('DOG')) == [0, 1]
+    assert list(index.postings('bird')) == []
+    assert index.lookup('dog') == ['a', 'b']
+    assert index.docs.resolve(intersect(index.postings('dog'), index.postings('cat'))) == ['a']
+    assert index.docs.resolve(union(index.postings('dog'), index.postings('cat'))) == ['a', 'b', 'c']
+
+    # Results come back in keyword_to_titles order for the real data
+    index = KeywordIndex(KEYWORD_TO_TITLES, TITLE_TO_INFO)
+    for keyword, titles in KEYWORD_TO_TITLES.items():
+        assert index.lookup(keyword) == titles
+
+
+def test_index_builder():
+    ''' Tests for IndexBuilder and its incremental updates. '''
+    builder = IndexBuilder(deepcopy(METADATA))
+    assert builder.keyword_to_titles() == keyword_to_titles(METADATA)
+    assert list(builder.keyword_to_titles()) == list(keyword_to_titles(METADATA))
+    assert builder.title_to_info() == title_to_info(METADATA)
+
+    metadata = deepcopy(METADATA)
+    builder.remove_article(metadata[3][0])
+    del metadata[3]
+    metadata[5] = metadata[5][:4] + [['zzyzx', 'music']]
+    builder.update_article(metadata[5])
+    metadata.append(['Zzyzx', 'andrea', 1234567890, 103, ['zzyzx', 'dog']])
+    builder.add_article(metadata[-1])
+
+    assert builder.metadata() == metadata
+    assert builder.keyword_to_titles() == keyword_to_titles(metadata)
+    assert list(builder.keyword_to_titles()) == list(keyword_to_titles(metadata))
+    assert builder.title_to_info() == title_to_info(metadata)
+
+
+def test_snapshot():
+    ''' Tests for the binary constants snapshot. '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'constants.snapshot')
+        write_snapshot(path)
+        values = read_snapshot(path)
+        assert values['METADATA'] == METADATA
+        assert values['ADVANCED_TO_QUESTION'] == ADVANCED_TO_QUESTION
+        assert 'KEYWORD_TO_TITLES' not in values
+
+        with open(path, 'r+b') as f:
+            f.seek(len(SNAPSHOT_MAGIC))
+            f.write(b'\xff\xff')
+        try:
+            read_snapshot(path)
+            assert False
+        except ValueError:
+            pass
+        # An unreadable snapshot falls back to constants.py
+        assert load_constants(path)['METADATA'] == METADATA
+
+
+def test_lazy_wiki():
+    ''' Tests that a query does not load the network stack. '''
+    code = "import sys, search; search.search('dog'); print('requests' in sys.modules)"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'constants.snapshot')
+        write_snapshot(path)
+        code = "import snapshot; snapshot.SNAPSHOT_PATH = {!r}; ".format(path) + code
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert output.strip() == b'False'
+        # Nor does falling back to constants.py without a snapshot
+        missing = os.path.join(directory, 'missing.snapshot')
+        code = code.replace(repr(path), repr(missing))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert output.strip() == b'False'
+
+
+def test_build_from_extracts():
+    ''' Tests that the parallel index build matches the serial one. '''
+    info, extracts = fake_articles(50)
+    words = ['music', 'rock', 'jazz', 'the', 'dog', 'soccer', 'python', 'travel']
+    for seed, article_id in enumerate(extracts):
+        extracts[article_id] = fake_extract(words[seed % 5:], 400 + 50 * seed, seed)
+    extracts['1007'] = None
+
+    metadata, info_map, keyword_map = build_from_extracts(info, extracts)
+    assert len(metadata) == 49
+    assert info_map == title_to_info(metadata)
+    assert keyword_map == keyword_to_titles(metadata)
+    assert list(keyword_map) == list(keyword_to_titles(metadata))
+    assert build_from_extracts(info, extracts, processes=3, chunk_size=7) == (metadata, info_map, keyword_map)
+
+
+def test_analyzer():
+    ''' Tests the analyzer chain at index and query time. '''
+    analyzer = Analyzer([lowercase, stopwords(['the']), min_length(3)])
+    assert analyzer.analyze('The Dog, the CAT and a ox') == ['dog', 'cat', 'and']
+    assert analyzer.term('THE') is None
+
+    assert search('the') != []
+    index.analyzer = ENGLISH_ANALYZER
+    try:
+        assert search('the') == []
+        assert search('Dog') == DOG
+        assert 'the' not in keyword_index()._postings
+    finally:
+        index.analyzer = DEFAULT_ANALYZER
+    assert search('the') == KEYWORD_TO_TITLES['the']
+
+
+def test_stemming():
+    ''' Tests that stemming lets word variants share postings. '''
+    assert [light_stem(word) for word in ['music', 'musical', 'musician', 'musicians']] == ['music'] * 4
+    assert [light_stem(word) for word in ['programming', 'programmers', 'plays', 'class', 'countries']] == \
+        ['program', 'program', 'play', 'class', 'country']
+    # Words that only look like a variant keep their meaning
+    unrelated = ['news', 'united', 'former', 'helders', 'number', 'water', 'noted', 'never', 'string', 'added']
+    assert [light_stem(word) for word in unrelated] == \
+        ['news', 'united', 'former', 'helder', 'number', 'water', 'note', 'never', 'string', 'add']
+    assert light_stem('new') != light_stem('news') and light_stem('unit') != light_stem('united')
+    assert light_stem('hoping') == light_stem('hope') and light_stem('running') == 'run'
+
+    stemmer = Stemmer(cache_size=2)
+    assert [stemmer(word) for word in ['dogs', 'dogs', 'cats', 'birds', 'dogs']] == ['dog', 'dog', 'cat', 'bird', 'dog']
+    assert stemmer.cache_info().hits == 1
+    assert stemmer.cache_info().currsize == 2
+
+    stemmed = KeywordIndex(KEYWORD_TO_TITLES, TITLE_TO_INFO, STEMMING_ANALYZER)
+    assert sorted(stemmed.surface_forms('Musicians')) == ['music', 'musical', 'musician', 'musicians']
+    variants = set()
+    for keyword in ['music', 'musical', 'musician', 'musicians']:
+        variants.update(KEYWORD_TO_TITLES[keyword])
+    assert stemmed.lookup('musical') == [title for title in TITLE_TO_INFO if title in variants]
+
+    index.analyzer = STEMMING_ANALYZER
+    try:
+        assert set(search('music')) == variants
+    finally:
+        index.analyzer = DEFAULT_ANALYZER
+    assert search('music') == MUSIC
+    index.analyzer = STEMMING_ANALYZER
+    try:
+        assert search('form') == search('forms')
+        assert not set(search('former')) <= set(search('form'))
+    finally:
+        index.analyzer = DEFAULT_ANALYZER
+
+
+def test_ranked_search():
+    ''' Tests BM25 ranking with term frequencies. '''
+    info = [{'title': title, 'contributor_username': author, 'id': str(number), 'timestamp': str(number),
+             'num_characters': str(length)}
+            for number, (title, author, length) in enumerate([('short rock', 'a', 100), ('long rock', 'b', 1000),
+                                                              ('lots of rock', 'c', 100), ('jazz', 'd', 100)])]
+    extracts = {'0': 'rock ' * 6, '1': 'rock ' * 6 + 'jazz ' * 6, '2': 'rock ' * 20, '3': 'jazz ' * 6}
+    ranked = RankedIndex.from_extracts(info, extracts)
+    assert ranked.search('rock') == ['lots of rock', 'short rock', 'long rock']
+    assert ranked.search('rock', k=2) == ['lots of rock', 'short rock']
+    assert ranked.search('rock', ranked=False) == ['short rock', 'long rock', 'lots of rock']
+    assert ranked.search('jazz rock')[0] == 'long rock'
+    assert ranked.search(['JAZZ', 'missing']) == ['jazz', 'long rock']
+    assert ranked.search('missing') == []
+    # One set of fetched extracts numbers the articles the same way in every index
+    metadata = build_from_extracts(info, extracts)[0]
+    assert ranked.docs.titles == PositionalIndex.from_extracts(info, extracts).docs.titles == [row[0] for row in metadata]
+    assert ranked._frequencies['rock'].tolist() == [6, 6, 20]
+
+    # Emptied title lists and zero lengths leave nothing to rank rather than failing
+    empty = RankedIndex({'rock': ['a', 'b'], 'gone': []}, {'a': {'length': 0}, 'b': {'length': 0}})
+    assert empty.search('rock') == ['a', 'b'] and empty.search('gone') == []
+    KEYWORD_TO_TITLES['zzyzx'] = []
+    mark_changed()
+    try:
+        assert ranked_search('music', k=3) == ranked_index().search('music', k=3)
+    finally:
+        del KEYWORD_TO_TITLES['zzyzx']
+        mark_changed()
+
+    assert sorted(ranked_search('music', k=100)) == sorted(MUSIC)
+    assert len(ranked_search('music', k=5)) == 5
+    assert ranked_search('music', k=100, ranked=False) == MUSIC
+
+
+def test_ranked_search_pruning():
+    ''' Tests that MaxScore top-k returns the same ranking as scoring every match. '''
+    import random
+    chooser = random.Random(0)
+    words = ['w{}'.format(number) for number in range(40)]
+    titles = ['doc {}'.format(number) for number in range(300)]
+    keyword_to_titles = {}
+    term_frequencies = {}
+    title_to_info = {}
+    for title in titles:
+        title_to_info[title] = {'author': 'a', 'timestamp': 1, 'length': chooser.randint(50, 5000)}
+        # Low numbered words are common, high numbered ones rare
+        keywords = set(chooser.choice(words[:chooser.randint(1, 40)]) for _ in range(8))
+        term_frequencies[title] = {keyword: chooser.randint(1, 30) for keyword in keywords}
+        for keyword in keywords:
+            keyword_to_titles.setdefault(keyword, []).append(title)
+    ranked = RankedIndex(keyword_to_titles, title_to_info, term_frequencies)
+    for _ in range(200):
+        query = chooser.sample(words, chooser.randint(1, 5))
+        k = chooser.choice([1, 3, 10, 50, 400])
+        assert ranked.search(query, k) == ranked.search(query, k, pruned=False)
+    assert ranked.top_k('w0 w1', 0) == []
+    assert ranked.top_k('missing', 5) == []
+    assert [score for doc_id, score in ranked.top_k('w0 w39', 5)] == \
+        sorted(ranked.scores('w0 w39').values(), reverse=True)[:5]
+
+
+def test_boolean_search():
+    ''' Tests boolean queries over posting lists. '''
+    assert parse('music AND (rock OR jazz) NOT pop') == \
+        ('and', [('term', 'music'), ('or', [('term', 'rock'), ('term', 'jazz')]), ('not', ('term', 'pop'))])
+    assert parse('dog cat OR bird') == ('or', [('and', [('term', 'dog'), ('term', 'cat')]), ('term', 'bird')])
+    assert is_query('dog OR cat') and is_query('(dog)')
+    assert not is_query('dog') and not is_query('and')
+    # A lone operator is still a keyword
+    assert not is_query('AND') and not is_query('NOT') and is_query('AND OR')
+    assert search('AND') == search('and') and len(search('AND')) == 79
+    assert search('NOT') == search('not') and len(search('NOT')) == 24
+    for malformed in ['', 'dog AND', '(dog', 'dog)', 'OR dog', 'NOT']:
+        try:
+            parse(malformed)
+            assert False, malformed
+        except ValueError:
+            pass
+
+    # Galloping through a long list gives the same answer as merging
+    long = array('I', range(0, 1000, 3))
+    assert list(intersect(array('I', [3, 4, 300, 999]), long)) == [3, 300, 999]
+    assert list(difference(array('I', [1, 3, 6, 7]), long)) == [1, 7]
+
+    keyword_to_titles = {'rock': ['a', 'd'], 'music': ['a', 'b', 'c'], 'jazz': ['b', 'c'], 'pop': ['c']}
+    fake_index = KeywordIndex(keyword_to_titles, ['a', 'b', 'c', 'd'])
+    universe = lambda: array('I', range(len(fake_index.docs)))
+    query = lambda text: fake_index.docs.resolve(evaluate(parse(text), fake_index.postings, universe))
+    assert query('music AND (rock OR jazz) NOT pop') == ['a', 'b']
+    assert query('Rock OR pop') == ['a', 'c', 'd']
+    assert query('NOT music') == ['d']
+    assert query('NOT (jazz OR rock)') == []
+
+    assert search('music AND music') == MUSIC
+    assert search('music OR music') == MUSIC
+    assert search('music NOT soccer') == [title for title in MUSIC if title not in search('soccer')]
+    assert search('music AND') == []
+    assert multiple_keywords('dog OR soccer', []) == [title for title in title_to_info_map()
+                                                     if title in search('dog') + search('soccer')]
+
+
+def test_autocomplete():
+    ''' Tests prefix completions ordered by document frequency. '''
+    frequencies = {'music': 5, 'musical': 2, 'musician': 5, 'muse': 1, 'dog': 9, 'm': 1}
+    prefixes = PrefixIndex(frequencies, limit=3, cache_length=1)
+    assert prefixes.complete('mus') == ['music', 'musician', 'musical', 'muse']
+    assert prefixes.complete('m', 2) == ['music', 'musician']
+    assert prefixes.complete('m', 10) == ['music', 'musician', 'musical', 'm', 'muse']
+    assert prefixes.complete('', 1) == ['dog']
+    assert prefixes.complete('musician') == ['musician']
+    assert prefixes.complete('cat') == []
+    assert list(prefixes.run('musi')) == [3, 4, 5]
+
+    # Words shorter than cache_length do not take over their prefix's completions
+    assert PrefixIndex({'music': 5, 'musician': 5, 'm': 1}).complete('m') == ['music', 'musician', 'm']
+    assert PrefixIndex({'the': 50, 'their': 40, 'them': 30}, cache_length=4).complete('the') == ['the', 'their', 'them']
+    assert PrefixIndex({'the': 50, 'their': 40, 'them': 30}, cache_length=4).complete('thei') == ['their']
+
+    # Completions agree with a scan of the keyword map
+    keyword_to_titles = keyword_to_titles_map()
+    for prefix in ['m', 'Mu', 'pro', 'dog', 'zzz']:
+        matches = [keyword for keyword in keyword_to_titles if keyword.startswith(prefix.lower())]
+        expected = sorted(matches, key=lambda keyword: (-len(keyword_to_titles[keyword]), keyword))[:10]
+        assert autocomplete(prefix) == expected
+    assert autocomplete('music', 3)[0] == 'music'
+
+    # Stemmed terms are shown as their most common keyword
+    index.analyzer = STEMMING_ANALYZER
+    try:
+        assert autocomplete('dalm') == ['dalmatian']
+        assert autocomplete('comp', 3) == ['composer', 'computer', 'compiler']
+        assert all(keyword in KEYWORD_TO_TITLES for keyword in autocomplete('m', 10))
+        assert did_you_mean('computr') == 'computer'
+    finally:
+        index.analyzer = DEFAULT_ANALYZER
+
+
+@patch('builtins.input')
+def test_fuzzy_search(input_mock):
+    ''' Tests typo-tolerant lookups and the did you mean suggestion. '''
+    assert edit_distance('musik', 'music', 2) == 1
+    assert edit_distance('dgo', 'dog', 2) == 1
+    assert edit_distance('kitten', 'sitting', 5) == 3
+    assert edit_distance('kitten', 'sitting', 2) == 3
+    assert edit_distance('same', 'same', 0) == 0
+
+    fuzzy = FuzzyIndex({'music': 30, 'musical': 4, 'must': 2, 'dog': 5, 'fog': 1, 'programming': 8})
+    assert fuzzy.lookup('musik') == [('music', 1), ('must', 2)]
+    assert fuzzy.lookup('musik', 1) == [('music', 1)]
+    assert fuzzy.lookup('musicl') == [('music', 1), ('musical', 1)]
+    assert fuzzy.lookup('dgo') == [('dog', 1)]
+    assert fuzzy.lookup('programing') == [('programming', 1)]
+    assert fuzzy.lookup('xylophone') == []
+    assert fuzzy.suggest('gog') == 'dog'
+    assert fuzzy.suggest('dog') == 'fog'
+    assert fuzzy.suggest('zzzz') is None
+
+    assert did_you_mean('programing') == 'programming'
+    assert did_you_mean('Musik') == 'music'
+    assert did_you_mean('music') is None
+    assert did_you_mean('') is None
+    assert set(search('music')) <= set(fuzzy_search('musik'))
+    assert fuzzy_search('musik', 0) == []
+
+    keyword = 'programing'
+    advanced_option = 6
+    output = get_print(input_mock, [keyword, advanced_option])
+    expected = print_basic() + keyword + '\n' + print_advanced() + str(advanced_option) + "\n\nNo articles found\nDid you mean: programming?\n"
+    assert output == expected
+
+
+def test_wildcard_search():
+    ''' Tests wildcard patterns over the k-gram index. '''
+    kgrams = KGramIndex(['music', 'musical', 'museum', 'biology', 'ology', 'photo', 'telephoto', 'rollrock', 'rock', 'my'])
+    assert kgrams.match('mus*') == ['museum', 'music', 'musical']
+    assert kgrams.match('*ology') == ['biology', 'ology']
+    assert kgrams.match('*photo*') == ['photo', 'telephoto']
+    assert list(kgrams.candidates('*rock*roll*')) == [8]
+    assert kgrams.match('*rock*roll*') == []
+    assert kgrams.match('m*') == ['museum', 'music', 'musical', 'my']
+    assert kgrams.match('*y') == ['biology', 'my', 'ology']
+    assert kgrams.match('rock') == ['rock']
+    assert kgrams.match('x*') == []
+    assert list(kgrams.candidates('*photo*')) == [6, 9]
+
+    assert list(union_all([array('I', [1, 4]), array('I', [2, 4, 9]), array('I')])) == [1, 2, 4, 9]
+
+    keyword_to_titles = keyword_to_titles_map()
+    for pattern in ['mus*', '*ology', '*photo*', 'p*g', '*s']:
+        regex = pattern.replace('*', '.*')
+        matching = {title for keyword, titles in keyword_to_titles.items()
+                    if re.fullmatch(regex, keyword) for title in titles}
+        assert wildcard_search(pattern) == [title for title in title_to_info_map() if title in matching]
+    assert search('Mus*') == wildcard_search('mus*')
+    assert search('mus* NOT music') == [title for title in search('mus*') if title not in MUSIC]
+
+
+def test_positional_index():
+    ''' Tests phrase and NEAR/k queries over a positional index. '''
+    assert encode_positions([0, 1, 200, 100000]) == b'\x00\x01\xc7\x01\xd8\x8b\x06'
+    assert decode_positions(encode_positions([3, 4, 127, 128, 70000])) == [3, 4, 127, 128, 70000]
+    assert decode_positions(b'') == []
+
+    def phrase_search(positions, text):
+        # Evaluates a query over the positional index alone, words included
+        universe = lambda: array('I', range(len(positions.docs)))
+        return positions.docs.resolve(evaluate(parse(text), positions.postings, universe, positions))
+
+    texts = ['Time travel is hard. Travel in time', 'the time of travel', 'hip hop music and more hip hop', 'Hop, hip']
+    positions = PositionalIndex(texts, ['a', 'b', 'c', 'd'])
+    assert positions.positions('travel', 0) == [1, 4]
+    assert positions.positions('travel', 2) == []
+    assert phrase_search(positions, '"time travel"') == ['a']
+    assert phrase_search(positions, '"Hip Hop" music') == ['c']
+    assert phrase_search(positions, 'time NEAR/1 travel') == ['a']
+    assert phrase_search(positions, 'time NEAR/2 travel') == ['a', 'b']
+    assert phrase_search(positions, 'hip NEAR/1 hop') == ['c', 'd']
+    assert phrase_search(positions, 'hip NEAR/4 hip') == []
+    assert phrase_search(positions, 'hip NEAR/5 hip') == ['c']
+    assert phrase_search(positions, '"time travel" OR "hip hop"') == ['a', 'c']
+    assert phrase_search(positions, 'travel NOT "time travel"') == ['b']
+
+    # Dropped words still take up a position
+    english = PositionalIndex(texts, ['a', 'b', 'c', 'd'], ENGLISH_ANALYZER)
+    assert phrase_search(english, '"time of travel"') == ['b']
+    assert phrase_search(english, '"time travel"') == ['a']
+
+    # Terms outside the top ones only narrow phrases down to documents with every word
+    small = PositionalIndex(texts, ['a', 'b', 'c', 'd'], top_terms=2)
+    assert sorted(small._positions) == ['hip', 'hop']
+    assert small.size() < positions.size()
+    assert small.positions('travel', 0) is None
+    assert phrase_search(small, '"time travel"') == ['a', 'b']
+    assert phrase_search(small, '"hip hop"') == ['c']
+
+    for malformed in ['"time travel', 'time NEAR/2', 'NEAR/2 time', 'time NEAR/2 (travel)']:
+        try:
+            parse(malformed)
+            assert False, malformed
+        except ValueError:
+            pass
+    assert is_query('"time travel"') and is_query('a NEAR/3 b')
+
+    info, extracts = fake_articles(3)
+    extracts[info[0]['id']] = 'Time travel is hard'
+    extracts[info[1]['id']] = 'the time of travel'
+    del extracts[info[2]['id']]
+    built = PositionalIndex.from_extracts(info, extracts)
+    assert phrase_search(built, '"time travel"') == [info[0]['title']]
+    assert phrase_search(built, 'time NEAR/2 travel') == [info[0]['title'], info[1]['title']]
+    assert search('"time travel"') == []
+    # search() only returns articles of its own collection
+    index.positions = built
+    try:
+        assert search('"time travel"') == []
+    finally:
+        index.positions = None
+
+    # In search(), words, wildcards and range filters around a phrase use the keyword index
+    index.positions = PositionalIndex(['Time travel is hard', 'the time of travel', 'time travel again'],
+                                      ['Guide dog', MUSIC[0], MUSIC[1]])
+    try:
+        assert search('"time travel" dog') == ['Guide dog']
+        assert search('"time travel" music') == [MUSIC[1]]
+        assert search('"time travel" mus*') == [MUSIC[1]]
+        assert search('"time travel" NOT dog') == [MUSIC[1]]
+        assert search('"time travel" length<=6000') == [MUSIC[1]]
+        assert search('time NEAR/2 travel music') == [MUSIC[0], MUSIC[1]]
+        assert search('"time travel" soccer') == []
+    finally:
+        index.positions = None
+
+
+@patch('builtins.input')
+def test_numeric_index(input_mock):
+    ''' Tests range filters over sorted length and timestamp columns. '''
+    lengths = NumericIndex([500, 20, 300, 20, 9000])
+    assert list(lengths.span(20, 300)) == [1, 3, 2]
+    assert list(lengths.doc_ids(high=300)) == [1, 2, 3]
+    assert list(lengths.doc_ids(low=301)) == [0, 4]
+    assert list(lengths.doc_ids(600, 800)) == []
+    assert list(lengths.ranks) == [3, 0, 2, 1, 4]
+    assert list(lengths.filter(array('I', [0, 1, 4]), high=500)) == [0, 1]
+    assert list(lengths.filter(array('I', [2]), high=500)) == [2]
+    assert list(lengths.filter(array('I', [0, 3]))) == [0, 3]
+
+    assert parse('music length<=5000 after:2008') == \
+        ('and', [('term', 'music'), ('range', 'length', None, 5000), ('range', 'timestamp', 1230768000, None)])
+    assert parse('length>5') == ('range', 'length', 6, None)
+    assert parse('before:2008') == ('range', 'timestamp', None, 1199145599)
+    assert is_query('length<=5') and not is_query('length')
+    # Years calendar.timegm() has no timestamp for are left as words
+    assert is_query('after:9998') and not is_query('after:9999') and not is_query('before:0000')
+    for keyword in ['after:9999', 'before:0000', 'dog before:0000']:
+        assert search(keyword) == []
+
+    title_to_info = title_to_info_map()
+    for keyword in ['music', 'dog', 'soccer', 'nothing']:
+        for max_length in [0, 3000, 8000, 200000]:
+            assert search(keyword + ' length<=' + str(max_length)) == \
+                article_length(max_length, search(keyword), title_to_info)
+    assert search('music after:2008') == [title for title in MUSIC if title_to_info[title]['timestamp'] >= 1230768000]
+    assert search('music NOT after:2008') == [title for title in MUSIC if title_to_info[title]['timestamp'] < 1230768000]
+    assert search('length<=40') == [title for title, info in title_to_info.items() if info['length'] <= 40]
+    try:
+        numeric_index('author')
+        assert False
+    except ValueError:
+        pass
+
+    keyword = 'dog'
+    advanced_option = 2
+    advanced_response = 8000
+    output = get_print(input_mock, [keyword, advanced_option, advanced_response])
+    expected = print_basic() + keyword + '\n' + print_advanced() + str(advanced_option) + '\n' + print_advanced_option(advanced_option) + str(advanced_response) + "\n\nHere are your articles: ['Mexican dog-faced bat', 'Guide dog']\n"
+    assert output == expected
+
+    # The length option keeps what article_length() would, lone operators included
+    for keyword in ['AND', 'NOT', 'dog']:
+        articles = article_length(10 ** 9, search(keyword), title_to_info)
+        assert len(articles) == len(search(keyword)) > 0
+        output = get_print(input_mock, [keyword, 2, 10 ** 9])
+        assert output.endswith('Here are your articles: ' + str(articles) + '\n')
+
+
 # Write tests above this line. Do not remove.
 
 # This automatically gets called when this file runs - this is how Python works.
@@ -324,5 +838,21 @@ if __name__ == "__main__":
     test_integration_programming_6()
     test_title_to_info_tests()
     test_keyword_to_titles()
+    test_keyword_index()
+    test_keyword_index_postings()
+    test_index_builder()
+    test_snapshot()
+    test_lazy_wiki()
+    test_build_from_extracts()
+    test_analyzer()
+    test_stemming()
+    test_ranked_search()
+    test_ranked_search_pruning()
+    test_boolean_search()
+    test_autocomplete()
+    test_fuzzy_search()
+    test_wildcard_search()
+    test_positional_index()
+    test_numeric_index()
     
     
@@ -0,0 +1,87 @@
+import marshal
+import os
+import struct
+
+# A snapshot is the magic bytes, a header holding the snapshot format version
+# and the marshal version used, then a marshalled dictionary of the constants
+# defined in constants.py. Constants that wiki.py derives from METADATA on
+# demand are left out.
+SNAPSHOT_MAGIC = b'PSESNAP\0'
+SNAPSHOT_VERSION = 2
+DERIVED_CONSTANTS = ('TITLE_TO_INFO', 'KEYWORD_TO_TITLES')
+SNAPSHOT_HEADER = struct.Struct('<HH')
+
+_here = os.path.dirname(os.path.abspath(__file__))
+CONSTANTS_PATH = os.path.join(_here, 'constants.py')
+SNAPSHOT_PATH = os.path.join(_here, 'constants.snapshot')
+
+def _constants_module():
+  """ Returns a dictionary of every constant defined in constants.py
+  """
+  import constants
+  return {name: value for name, value in vars(constants).items() if name.isupper()}
+
+def write_snapshot(path=None, values=None):
+  """Writes a binary snapshot of the constants
+
+  Args:
+    path - file to write the snapshot to, defaults to SNAPSHOT_PATH
+    values - dictionary of constant name to value, defaults to constants.py;
+             DERIVED_CONSTANTS are not written
+  """
+  path = path or SNAPSHOT_PATH
+  if values is None:
+    values = _constants_module()
+  values = {name: value for name, value in values.items() if name not in DERIVED_CONSTANTS}
+  with open(path, 'wb') as f:
+    f.write(SNAPSHOT_MAGIC)
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, marshal.version))
+    marshal.dump(values, f)
+
+def read_snapshot(path=None):
+  """Reads a snapshot written by write_snapshot()
+
+  Raises ValueError if the file is not a snapshot or was written by another
+  snapshot or marshal version. Snapshots are a local build artifact and must
+  not be read from untrusted sources.
+
+  Args:
+    path - file to read the snapshot from, defaults to SNAPSHOT_PATH
+  """
+  path = path or SNAPSHOT_PATH
+  with open(path, 'rb') as f:
+    data = f.read()
+  header_end = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+  if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or len(data) < header_end:
+    raise ValueError('not a constants snapshot: ' + path)
+  version, marshal_version = SNAPSHOT_HEADER.unpack(data[len(SNAPSHOT_MAGIC):header_end])
+  if version != SNAPSHOT_VERSION or marshal_version != marshal.version:
+    raise ValueError('unsupported snapshot version {}/{}: {}'.format(version, marshal_version, path))
+  return marshal.loads(data[header_end:])
+
+def _modified(path):
+  """ Returns the modification time of path in nanoseconds, or None if it is missing
+  """
+  try:
+    return os.stat(path).st_mtime_ns
+  except OSError:
+    return None
+
+def load_constants(path=None):
+  """ Returns a dictionary of constants, read from the snapshot when it is present,
+  readable and at least as new as constants.py, otherwise from constants.py. Only
+  the constants.py fallback includes DERIVED_CONSTANTS.
+  """
+  path = path or SNAPSHOT_PATH
+  snapshot_time = _modified(path)
+  constants_time = _modified(CONSTANTS_PATH)
+  if snapshot_time is not None and (constants_time is None or snapshot_time >= constants_time):
+    try:
+      return read_snapshot(path)
+    except (ValueError, EOFError, TypeError):
+      pass
+  return _constants_module()
+
+if __name__ == '__main__':
+  write_snapshot()
+  print('Wrote ' + SNAPSHOT_PATH)
@@ -0,0 +1,230 @@
+from array import array
+from bisect import bisect_left
+import heapq
+import re
+
+# Sorts after every character, so prefix + _LAST bounds all words starting with prefix
+_LAST = '\U0010ffff'
+
+class PrefixIndex:
+  """Sorted vocabulary answering prefix completions by document frequency
+
+  The words starting with a prefix form one run of the sorted vocabulary,
+  found with two bisections. The best completions of short prefixes, whose
+  runs are long, are worked out once up front; longer prefixes have short
+  runs that are ranked when asked for.
+
+  Args:
+    frequencies - dictionary mapping word to the number of documents it is in
+    limit - most completions worked out up front for each short prefix
+    cache_length - longest prefix to work completions out for up front
+  """
+
+  def __init__(self, frequencies, limit=10, cache_length=2):
+    self.words = sorted(frequencies)
+    self.frequencies = array('I', [frequencies[word] for word in self.words])
+    self.limit = limit
+    self.cache_length = cache_length
+    self._top = {}
+    for length in range(cache_length + 1):
+      runs = {}
+      for position, word in enumerate(self.words):
+        # Shorter words belong to the runs of their own shorter prefixes
+        if len(word) >= length:
+          runs.setdefault(word[:length], []).append(position)
+      for prefix, positions in runs.items():
+        self._top[prefix] = [self.words[position] for position in self._best(positions, limit)]
+
+  def __len__(self):
+    return len(self.words)
+
+  def _best(self, positions, n):
+    """ Returns the n positions with the highest document frequency, ties
+    going to the alphabetically first word
+    """
+    frequencies = self.frequencies
+    return heapq.nlargest(n, positions, key=lambda position: (frequencies[position], -position))
+
+  def run(self, prefix):
+    """ Returns the range of positions of the words starting with prefix
+    """
+    return range(bisect_left(self.words, prefix), bisect_left(self.words, prefix + _LAST))
+
+  def complete(self, prefix, n=10):
+    """ Returns up to n words starting with prefix, most frequent first
+    """
+    if len(prefix) <= self.cache_length and n <= self.limit:
+      return self._top.get(prefix, [])[:n]
+    return [self.words[position] for position in self._best(self.run(prefix), n)]
+
+def edit_distance(first, second, limit):
+  """Returns the edit distance between two words, counting insertions,
+  deletions, substitutions and swaps of neighbouring characters, or limit + 1
+  if it is above limit
+
+  Args:
+    first - word
+    second - word
+    limit - largest distance worth computing exactly
+  """
+  if abs(len(first) - len(second)) > limit:
+    return limit + 1
+  before = None
+  previous = list(range(len(second) + 1))
+  for i, char in enumerate(first, 1):
+    current = [i] + [0] * len(second)
+    for j, other in enumerate(second, 1):
+      cost = char != other
+      current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+      if before is not None and j > 1 and char == second[j - 2] and first[i - 2] == other:
+        current[j] = min(current[j], before[j - 2] + 1)
+    if min(current) > limit:
+      return limit + 1
+    before, previous = previous, current
+  return min(previous[-1], limit + 1)
+
+def _deletes(word, distance):
+  """ Returns the set of strings left by deleting up to distance characters
+  from word, word included
+  """
+  found = {word}
+  edge = {word}
+  for _ in range(distance):
+    edge = {variant[:i] + variant[i + 1:] for variant in edge for i in range(len(variant))}
+    found |= edge
+  return found
+
+# Words this short are only matched within edit distance 1 by default, as
+# almost every short word is within 2 of many others
+SHORT_WORD = 4
+
+class FuzzyIndex:
+  """Symmetric delete dictionary finding the words within a small edit
+  distance of a misspelling
+
+  Every string left by deleting up to max_distance characters from a word
+  points back to that word. Deleting the same number of characters from the
+  query gives a handful of strings to look up, and the words they lead to
+  are checked with edit_distance(). A lookup costs a few dozen dictionary
+  probes whatever the size of the vocabulary.
+
+  Args:
+    frequencies - dictionary mapping word to the number of documents it is in
+    max_distance - largest edit distance lookups can ask for
+  """
+
+  def __init__(self, frequencies, max_distance=2):
+    self.max_distance = max_distance
+    self.frequencies = dict(frequencies)
+    self._deletes = {}
+    for word in self.frequencies:
+      for variant in _deletes(word, max_distance):
+        self._deletes.setdefault(variant, []).append(word)
+
+  def __len__(self):
+    return len(self.frequencies)
+
+  def _limit(self, word, max_distance):
+    """ Returns the edit distance to search word within, given the one asked for
+    """
+    if max_distance is None:
+      max_distance = 1 if len(word) <= SHORT_WORD else self.max_distance
+    return min(max_distance, self.max_distance)
+
+  def lookup(self, word, max_distance=None):
+    """Returns (word, distance) pairs for the words within max_distance of
+    word, closest first, then the most frequent, then alphabetically
+
+    Args:
+      word - possibly misspelled word
+      max_distance - largest edit distance to accept, at most the index's;
+                     by default 1 for words of up to SHORT_WORD characters
+                     and the index's for longer ones
+    """
+    max_distance = self._limit(word, max_distance)
+    candidates = set()
+    for variant in _deletes(word, max_distance):
+      candidates.update(self._deletes.get(variant, ()))
+    matches = []
+    for candidate in candidates:
+      if abs(len(candidate) - len(word)) > max_distance:
+        continue
+      distance = edit_distance(word, candidate, max_distance)
+      if distance <= max_distance:
+        matches.append((candidate, distance))
+    matches.sort(key=lambda match: (match[1], -self.frequencies[match[0]], match[0]))
+    return matches
+
+  def suggest(self, word, max_distance=None):
+    """ Returns the closest, most frequent other word within max_distance of
+    word, defaulting as in lookup(), or None
+    """
+    max_distance = self._limit(word, max_distance)
+    # Closer words win, so wider searches are only needed when nothing is close
+    for distance in range(1, max_distance + 1):
+      for match, _ in self.lookup(word, distance):
+        if match != word:
+          return match
+    return None
+
+# Marks the start and end of a word in its k-grams, so 'mus*' only matches
+# words starting with 'mus'
+_BOUNDARY = '$'
+
+class KGramIndex:
+  """Character k-gram index over a vocabulary for wildcard patterns
+
+  Each k-gram of a word padded with _BOUNDARY points to the word's position
+  in the sorted vocabulary. A pattern such as 'mus*', '*ology' or '*photo*'
+  is split at its wildcards and the k-grams of the pieces are intersected to
+  narrow it to a few candidates, which are then matched against the pattern
+  itself, since having the right k-grams is not enough: 'rollrock' has
+  every k-gram of '*rock*roll*'. Patterns without a piece of k characters fall
+  back to the words sharing their leading characters, or to every word.
+
+  Args:
+    words - the vocabulary
+    k - characters per gram
+  """
+
+  def __init__(self, words, k=3):
+    self.k = k
+    self.words = sorted(words)
+    self._grams = {}
+    for position, word in enumerate(self.words):
+      for gram in set(self._grams_of(_BOUNDARY + word + _BOUNDARY)):
+        self._grams.setdefault(gram, array('I')).append(position)
+
+  def __len__(self):
+    return len(self.words)
+
+  def _grams_of(self, piece):
+    return [piece[i:i + self.k] for i in range(len(piece) - self.k + 1)]
+
+  def candidates(self, pattern):
+    """ Returns the sorted positions of the words that could match pattern
+    """
+    pieces = (_BOUNDARY + pattern + _BOUNDARY).split('*')
+    grams = {gram for piece in pieces for gram in self._grams_of(piece)}
+    if not grams:
+      prefix = pieces[0][1:] if len(pieces) > 1 else pattern
+      return range(bisect_left(self.words, prefix), bisect_left(self.words, prefix + _LAST))
+    lists = sorted((self._grams.get(gram, ()) for gram in grams), key=len)
+    positions = lists[0]
+    for posting in lists[1:]:
+      positions = [position for position in positions if _contains(posting, position)]
+    return positions
+
+  def match(self, pattern):
+    """ Returns the words matching pattern, where * stands for any characters,
+    in alphabetical order
+    """
+    regex = re.compile('.*'.join(map(re.escape, pattern.split('*'))))
+    words = self.words
+    return [words[position] for position in self.candidates(pattern) if regex.fullmatch(words[position])]
+
+def _contains(posting, position):
+  """ Returns True if the sorted posting list contains position
+  """
+  i = bisect_left(posting, position)
+  return i < len(posting) and posting[i] == position
@@ -1,93 +1,405 @@
-from constants import ADVANCED, ADVANCED_TO_QUESTION, BASIC, WIKI_API, ARTICLES, METADATA, TITLE_TO_INFO, KEYWORD_TO_TITLES
+from bisect import insort
+from collections import Counter
+from snapshot import load_constants
 import json
 import re
-import requests
+
+# Names loaded on first use, see __getattr__()
+_LAZY_CONSTANTS = ('ADVANCED', 'ADVANCED_TO_QUESTION', 'BASIC', 'WIKI_API', 'ARTICLES',
+                   'METADATA', 'TITLE_TO_INFO', 'KEYWORD_TO_TITLES')
+_constants = {}
+
+# Bumped whenever the live maps are changed in place, see mark_changed()
+_data_version = 0
+
+def _article_info(row):
+  """ Returns the author, timestamp and length mapping of a metadata row
+  """
+  return {'author': row[1], 'timestamp': row[2], 'length': row[3]}
+
+def _title_to_info(metadata):
+  """ Returns a mapping of article title to author, timestamp and length
+  """
+  return {article[0]: _article_info(article) for article in metadata}
+
+def _keyword_to_titles(metadata):
+  """ Returns a mapping of keyword to titles of articles with keyword
+  """
+  keyword_to_titles = {}
+  for article in metadata:
+    for keyword in article[4]:
+      keyword_to_titles.setdefault(keyword, []).append(article[0])
+  return keyword_to_titles
+
+def _constant(name):
+  """ Returns the named constant, loading the constants the first time one is
+  needed and deriving TITLE_TO_INFO and KEYWORD_TO_TITLES from METADATA the
+  first time each is needed
+  """
+  if not _constants:
+    # Read from the binary snapshot written by snapshot.py when there is one
+    _constants.update(load_constants())
+  if name not in _constants:
+    if name == 'TITLE_TO_INFO':
+      _constants[name] = _title_to_info(_constant('METADATA'))
+    elif name == 'KEYWORD_TO_TITLES':
+      _constants[name] = _keyword_to_titles(_constant('METADATA'))
+  return _constants[name]
+
+def __getattr__(name):
+  if name in _LAZY_CONSTANTS:
+    return _constant(name)
+  raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 threshold = 5
+_WORD = re.compile(r'\w+')
 
-def _find_keywords(article):
-  keywords = []
+# Extracts longer than this many characters are tokenized in chunks
+STREAM_THRESHOLD = 256 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Most pages the API returns extracts for in one request
+MAX_BATCH_SIZE = 20
+
+def _tokenize(chunks):
+  """ Yields the words of text given as an iterable of string chunks, joining
+  words split across chunks, so only about one chunk is held at a time
+  """
+  carry = ''
+  for chunk in chunks:
+    text = carry + chunk
+    words = _WORD.findall(text)
+    # A word running into the end of the chunk may continue in the next one
+    if words and _WORD.match(text, len(text) - 1):
+      carry = words.pop()
+    else:
+      carry = ''
+    yield from words
+  if carry:
+    yield carry
+
+def _chunks(text, size=STREAM_CHUNK_SIZE):
+  """ Yields text in pieces of size characters; text may be a string or a file
+  opened in text mode
+  """
+  if hasattr(text, 'read'):
+    yield from iter(lambda: text.read(size), '')
+  else:
+    for start in range(0, len(text), size):
+      yield text[start:start + size]
+
+def _keyword_counts(word_count):
+  """ Returns a mapping of keyword to the number of times it appears, from a
+  count of words as spelled in the text
+  """
+  # Merge spellings that lowercase alike. Counter keeps first appearances in
+  # order, so the merged counts do too. Words are lowercased one by one since
+  # lowercasing the whole text can change where words split (e.g. 'İ'
+  # lowercases to 'i' and a combining dot).
   count = {}
-  final_count = {}
+  for word, value in word_count.items():
+    key = word.lower()
+    count[key] = count.get(key, 0) + value
+  return {key: value for key, value in count.items() if value > threshold and len(key) > 2}
+
+def _find_keywords_stream(chunks):
+  """ Returns the keywords of text given as an iterable of string chunks,
+  counting words as they are read so memory does not grow with the text
+  """
+  return list(_keyword_counts(Counter(_tokenize(chunks))))
 
-  article = re.sub('\W+',' ', article).split(' ')
+def _find_keyword_counts(article):
+  """ Returns a mapping of each keyword of article to the number of times it
+  appears, in order of first appearance
+  """
+  if len(article) > STREAM_THRESHOLD:
+    return _keyword_counts(Counter(_tokenize(_chunks(article))))
+  return _keyword_counts(Counter(_WORD.findall(article)))
 
-  for word in article:
-    count[word.lower()] = count[word.lower()] + 1 if word.lower() in count.keys() else 1
+def _find_keywords(article):
+  """ Returns the lowercased words of article that appear more than threshold
+  times and are longer than two characters, in order of first appearance
+  """
+  return list(_find_keyword_counts(article))
 
-  for key, value in count.items():
-    if value > threshold and len(key) > 2:
-      keywords.append(key)
-      final_count[key] = value
+def _session(pool_size):
+  """ Returns a requests.Session that keeps up to pool_size connections alive
+  """
+  import requests
+
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+def _fetch_extract(session, api, article_id):
+  """ Returns the plain text extract of an article, or None if the request failed
+  """
+  resp = session.get(api.format(article_id))
+  if resp.status_code != 200:
+    return None
+  return resp.json().get('query').get('pages')[0].get('extract')
+
+def _fetch_batch(session, api, article_ids):
+  """ Returns a dictionary of article ID to plain text extract for several articles
+  fetched in one request. Articles whose page came back without an extract are
+  left out, as are all of them if the request failed.
+  """
+  page_to_id = {str(article_id): article_id for article_id in article_ids}
+  resp = session.get(api.format('|'.join(page_to_id)))
+  if resp.status_code != 200:
+    return {}
+  extracts = {}
+  for page in resp.json().get('query').get('pages'):
+    article_id = page_to_id.get(str(page.get('pageid')))
+    if article_id is not None and page.get('extract') is not None:
+      extracts[article_id] = page.get('extract')
+  return extracts
+
+def _fetch_extracts(article_ids, workers=1, api=None, batch_size=1, cache=None, revisions=None):
+  """Fetches the plain text extracts of articles from Wikipedia
+
+  Each ID is fetched once. With more than one worker the requests are made
+  concurrently, sharing one keep-alive session. With a batch size above one,
+  IDs are sent batch_size at a time (the API takes up to MAX_BATCH_SIZE) and
+  any article missing from a batch's response is fetched again on its own.
+  Articles found in the cache at their current revision are not requested,
+  and fetched ones are added to it.
+
+  Args:
+    article_ids - IDs of the articles to fetch
+    workers - maximum number of requests in flight
+    api - URL of the API with {} in place of the page ID, defaults to WIKI_API
+    batch_size - number of articles to ask for in each request
+    cache - cache.ExtractCache to read and store extracts, or None
+    revisions - dictionary mapping article ID to its revision for the cache
+
+  Returns a dictionary of article ID to extract, or None if the request
+  failed, in the order the IDs were first given
+  """
+  from concurrent.futures import ThreadPoolExecutor
+
+  api = api or _constant('WIKI_API')
+  article_ids = list(dict.fromkeys(article_ids))
+  batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+  extracts = dict.fromkeys(article_ids)
+  revisions = revisions or {}
+  if cache is not None:
+    for article_id in article_ids:
+      if article_id in revisions:
+        extracts[article_id] = cache.get(article_id, revisions[article_id])
+    article_ids = [article_id for article_id in article_ids if extracts[article_id] is None]
+
+  with _session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+    run = executor.map if workers > 1 else map
+    if batch_size > 1:
+      batches = [article_ids[i:i + batch_size] for i in range(0, len(article_ids), batch_size)]
+      for found in run(lambda batch: _fetch_batch(session, api, batch), batches):
+        extracts.update(found)
+
+    missing = [article_id for article_id in article_ids if extracts[article_id] is None]
+    for article_id, extract in zip(missing, run(lambda article_id: _fetch_extract(session, api, article_id), missing)):
+      extracts[article_id] = extract
 
-  return keywords
+  if cache is not None:
+    for article_id in article_ids:
+      if article_id in revisions and extracts[article_id] is not None:
+        cache.put(article_id, revisions[article_id], extracts[article_id])
+    cache.save()
+  return extracts
 
-def _create_id_to_metadata(info):
+def _create_id_to_metadata(info, workers=1, api=None, batch_size=1, cache=None):
   """Creates a dictionary of article ID to title, author, timestamp, num_characters, and list of keywords
 
+  Articles whose ID was already seen are skipped.
+
   Args:
     info - JSON of information from BigQuery
+    workers - maximum number of Wikipedia requests in flight
+    api - URL of the API with {} in place of the page ID, defaults to WIKI_API
+    batch_size - number of articles to ask Wikipedia for in each request
+    cache - cache.ExtractCache of extracts by page ID and timestamp, or None
   """
-  id_to_metadata = {}
-  id_set = set()
-  
+  id_to_item = {}
   for item in info:
     article_id = item.get('id')
-    #if article_id in id_set:
-    #  print(article_id)
-    id_set.add(article_id)
+    if article_id in id_to_item:
+      continue
     # Delete the id from the dict
     del item['id']
-  
-    #print(article_id)
-    # Make a request to Wikipedia
-    resp = requests.get(WIKI_API.format(article_id))
+    id_to_item[article_id] = item
+
+  # Make the requests to Wikipedia
+  revisions = {article_id: item.get('timestamp') for article_id, item in id_to_item.items()}
+  extracts = _fetch_extracts(id_to_item, workers, api, batch_size, cache, revisions)
 
-    if resp.status_code == 200:
-      item['keywords'] = _find_keywords(resp.json().get('query').get('pages')[0].get('extract'))
+  id_to_metadata = {}
+  for article_id, item in id_to_item.items():
+    if extracts[article_id] is not None:
+      item['keywords'] = _find_keywords(extracts[article_id])
       id_to_metadata[article_id] = item
   
   return id_to_metadata
 
-def _metadata_list(info):
+def _metadata_list(info, workers=1, api=None, batch_size=1, cache=None):
   """Creates a list of title, author, timestamp, num_characters, and list of keywords
 
+  Articles whose ID was already seen are skipped.
+
   Args:
     info - JSON of information from BigQuery
+    workers - maximum number of Wikipedia requests in flight
+    api - URL of the API with {} in place of the page ID, defaults to WIKI_API
+    batch_size - number of articles to ask Wikipedia for in each request
+    cache - cache.ExtractCache of extracts by page ID and timestamp, or None
   """
-  metadata = []
-  
+  id_to_item = {}
   for item in info:
-    # Make a request to Wikipedia
-    article_id = item.get('id')
-    resp = requests.get(WIKI_API.format(article_id))
+    id_to_item.setdefault(item.get('id'), item)
 
-    if resp.status_code == 200:
-      item['keywords'] = _find_keywords(resp.json().get('query').get('pages')[0].get('extract'))
+  # Make the requests to Wikipedia
+  revisions = {article_id: item.get('timestamp') for article_id, item in id_to_item.items()}
+  extracts = _fetch_extracts(id_to_item, workers, api, batch_size, cache, revisions)
+
+  metadata = []
+  for article_id, item in id_to_item.items():
+    if extracts[article_id] is not None:
+      item['keywords'] = _find_keywords(extracts[article_id])
       metadata.append(item)
   
   print(metadata)
   return metadata
 
+def _pipeline_metadata_list(info, **options):
+  """Creates the same list as _metadata_list() through the asyncio ingestion
+  pipeline, for large lists of articles
+
+  Args:
+    info - JSON of information from BigQuery
+    options - concurrency, rate limit, retry and queue options of pipeline.ingest()
+
+  Returns (metadata, dictionary of pipeline stage name to throughput counters)
+  """
+  import asyncio
+  from pipeline import ingest
+
+  return asyncio.run(ingest(info, **options))
+
+def _article_row(item, keywords):
+  """ Returns the [title, author, timestamp, article length, keywords] row for an article
+  """
+  return [item.get('title'), item.get('contributor_username'), int(item.get('timestamp')),
+          int(item.get('num_characters')), keywords]
+
+def _reindex(info, metadata=None, title_to_info=None, keyword_to_titles=None,
+             workers=1, api=None, batch_size=1, cache=None):
+  """Brings article metadata and its maps up to date with info in place
+
+  Only articles that are new, or whose timestamp or length differs from
+  their row, are fetched and have their keywords found again. Articles no
+  longer in info are removed. The maps are patched rather than rebuilt, and
+  posting lists stay in metadata order. An article whose fetch fails keeps
+  its old row, or is left out if it is new.
+
+  Args:
+    info - JSON of information from BigQuery, in the shape of ARTICLES
+    metadata - 2D list of article metadata to update, defaults to METADATA
+    title_to_info - its title to info mapping, defaults to TITLE_TO_INFO
+    keyword_to_titles - its keyword to titles mapping, defaults to KEYWORD_TO_TITLES
+    workers, api, batch_size, cache - fetch options of _fetch_extracts()
+
+  Returns a dictionary with the lists of 'added', 'updated', 'removed' and
+  'failed' titles
+  """
+  live = None in (metadata, title_to_info, keyword_to_titles)
+  metadata = article_metadata() if metadata is None else metadata
+  title_to_info = title_to_info_map() if title_to_info is None else title_to_info
+  keyword_to_titles = keyword_to_titles_map() if keyword_to_titles is None else keyword_to_titles
+
+  rows = {row[0]: row for row in metadata}
+  titles = set()
+  changed = {}
+  for item in info:
+    title = item.get('title')
+    titles.add(title)
+    row = rows.get(title)
+    if row is None or row[2] != int(item.get('timestamp')) or row[3] != int(item.get('num_characters')):
+      changed.setdefault(item.get('id'), item)
+
+  revisions = {article_id: item.get('timestamp') for article_id, item in changed.items()}
+  extracts = _fetch_extracts(changed, workers, api, batch_size, cache, revisions)
+
+  delta = {'added': [], 'updated': [], 'removed': [title for title in rows if title not in titles], 'failed': []}
+  new_rows = {}
+  for article_id, item in changed.items():
+    title = item.get('title')
+    if extracts[article_id] is None:
+      delta['failed'].append(title)
+    else:
+      new_rows[title] = _article_row(item, _find_keywords(extracts[article_id]))
+      delta['updated' if title in rows else 'added'].append(title)
+
+  # Take the old rows out of the keyword map
+  for title in delta['removed'] + delta['updated']:
+    for keyword in rows[title][4]:
+      posting = keyword_to_titles[keyword]
+      posting.remove(title)
+      if not posting:
+        del keyword_to_titles[keyword]
+
+  removed = set(delta['removed'])
+  metadata[:] = [new_rows.get(row[0], row) for row in metadata if row[0] not in removed]
+  metadata.extend(new_rows[title] for title in delta['added'])
+  for title in delta['removed']:
+    del title_to_info[title]
+  for title, row in new_rows.items():
+    title_to_info[title] = _article_info(row)
+
+  # Put the new rows in, keeping each posting list in metadata order
+  position = {row[0]: i for i, row in enumerate(metadata)}
+  for title, row in new_rows.items():
+    for keyword in row[4]:
+      insort(keyword_to_titles.setdefault(keyword, []), title, key=position.__getitem__)
+
+  # Only now, so an index rebuilt while fetching is not taken for up to date
+  if live:
+    mark_changed()
+  return delta
+
+def data_version():
+  """ Returns a number that changes whenever _reindex() or mark_changed()
+  updates the live maps
+  """
+  return _data_version
+
+def mark_changed():
+  """ Bumps data_version() after the live maps have been edited in place
+  outside _reindex(), such as a title removed from a keyword's list, which
+  indexes built from them cannot otherwise notice
+  """
+  global _data_version
+  _data_version += 1
+
 def article_titles():
   """ Returns a list of article titles
   """
-  return list(map(lambda article: article.get('title'), ARTICLES))
+  return list(map(lambda article: article.get('title'), _constant('ARTICLES')))
 
 def article_metadata():
   """ Returns a list of article metadata (list of lists)
   """
-  return METADATA
+  return _constant('METADATA')
 
 def title_to_info_map():
   """ Returns a mapping of article title to metadata mapping
   """
-  return TITLE_TO_INFO
+  return _constant('TITLE_TO_INFO')
 
 def keyword_to_titles_map():
   """ Returns a mapping of keyword to article titles with keyword
   """
-  return KEYWORD_TO_TITLES
+  return _constant('KEYWORD_TO_TITLES')
 
 def _count_for_titles():
   """ Returns titles that have words in other titles
@@ -105,10 +417,10 @@ def _count_for_titles():
   return count
 
 def ask_search():
-  return input(BASIC)
+  return input(_constant('BASIC'))
 
 def ask_advanced_search():
-  request = int(input(ADVANCED))
+  request = int(input(_constant('ADVANCED')))
   none = [1, 3, 6]
-  answer = input(ADVANCED_TO_QUESTION[request]) if request not in none else ''
+  answer = input(_constant('ADVANCED_TO_QUESTION')[request]) if request not in none else ''
   return [request, answer if request != 2 else int(answer)]
@@ -0,0 +1,207 @@
+from wiki import _chunks, _find_keywords_stream, _tokenize, _create_id_to_metadata, _metadata_list, _pipeline_metadata_list, _reindex, _find_keywords, _article_row, _session, article_metadata, data_version
+from search import title_to_info, keyword_to_titles
+from pipeline import TokenBucket
+import pipeline
+from cache import ExtractCache
+from wiki_tests_helper import FakeWikiAPI, fake_articles, fake_extract, reference_find_keywords
+from contextlib import redirect_stdout
+from copy import deepcopy
+from unittest.mock import patch
+import asyncio
+import io
+import re
+import tempfile
+import threading
+import tracemalloc
+import time
+
+def test_concurrent_fetch():
+    ''' Tests for concurrent ingestion against a local API. '''
+    info, extracts = fake_articles(20)
+    expected = {}
+    for item in deepcopy(info):
+        article_id = item.pop('id')
+        item['keywords'] = _find_keywords(extracts[article_id])
+        expected[article_id] = item
+
+    with FakeWikiAPI(extracts) as api:
+        assert _create_id_to_metadata(deepcopy(info), api=api.url) == expected
+        serial_requests = len(api.requests)
+        result = _create_id_to_metadata(deepcopy(info) + deepcopy(info[:5]), workers=8, api=api.url)
+        assert result == expected
+        assert list(result) == list(expected)
+        # Duplicate IDs are not fetched again
+        assert len(api.requests) == serial_requests * 2
+
+def test_metadata_list_failures():
+    ''' Tests that failed requests are left out of the metadata list. '''
+    info, extracts = fake_articles(6)
+    with FakeWikiAPI(extracts, failing=['1002']) as api:
+        with redirect_stdout(io.StringIO()):
+            metadata = _metadata_list(deepcopy(info), workers=4, api=api.url)
+    assert [item['title'] for item in metadata] == ['Article 0', 'Article 1', 'Article 3', 'Article 4', 'Article 5']
+    assert metadata[0]['keywords'] == ['shared', 'word', 'number0']
+
+def test_batched_fetch():
+    ''' Tests that batched ingestion splits responses and isolates failed pages. '''
+    info, extracts = fake_articles(100)
+    with FakeWikiAPI(extracts) as api:
+        expected = _create_id_to_metadata(deepcopy(info), api=api.url)
+        assert len(api.requests) == 100
+        assert _create_id_to_metadata(deepcopy(info), workers=4, api=api.url, batch_size=20) == expected
+        assert len(api.requests) == 105
+
+    # One failing page fails its batch, whose other pages are fetched on their own
+    del extracts['1047']
+    with FakeWikiAPI(extracts, failing=['1013']) as api:
+        result = _create_id_to_metadata(deepcopy(info), api=api.url, batch_size=20)
+        assert len(api.requests) == 5 + 20 + 1
+    assert list(result) == [article_id for article_id in expected if article_id not in ('1013', '1047')]
+
+def test_pipeline():
+    ''' Tests the asyncio ingestion pipeline, including retried requests. '''
+    info, extracts = fake_articles(30)
+    with FakeWikiAPI(extracts) as api:
+        with redirect_stdout(io.StringIO()):
+            expected = _metadata_list(deepcopy(info), api=api.url)
+
+    with FakeWikiAPI(extracts, failing=['1004'], flaky={'1010': 2, '1020': 5}) as api:
+        metadata, stats = _pipeline_metadata_list(deepcopy(info), api=api.url, concurrency=4,
+                                                  retries=3, backoff=0.01, queue_size=2)
+    assert metadata == [item for item in expected if item['id'] not in ('1004', '1020')]
+    assert stats['fetch'].items == 28
+    assert stats['fetch'].failures == 2
+    assert stats['fetch'].retries == 3 + 2 + 3
+    assert stats['extract'].items == stats['write'].items == 28
+
+    # Fetches and keyword extraction each run in a thread pool of their own
+    threads = {'fetch': set(), 'extract': set()}
+    def recording(stage, function):
+        def wrapper(*args):
+            threads[stage].add(threading.current_thread().name.split('_')[0])
+            return function(*args)
+        return wrapper
+    def session(pool_size):
+        session = _session(pool_size)
+        session.get = recording('fetch', session.get)
+        return session
+    with FakeWikiAPI(extracts) as api, patch.object(pipeline, '_session', session), \
+         patch.object(pipeline, '_find_keywords', recording('extract', _find_keywords)):
+        metadata, stats = _pipeline_metadata_list(deepcopy(info), api=api.url, concurrency=4)
+    assert metadata == expected
+    assert threads == {'fetch': {'fetch'}, 'extract': {'extract'}}
+
+def test_token_bucket():
+    ''' Tests that the token bucket spaces out requests. '''
+    async def take(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(take(TokenBucket(100), 11))
+    assert time.monotonic() - start >= 0.09
+
+def test_extract_cache():
+    ''' Tests that repeated ingestion is served from the extract cache. '''
+    info, extracts = fake_articles(10)
+    with tempfile.TemporaryDirectory() as directory, FakeWikiAPI(extracts) as api:
+        expected = _create_id_to_metadata(deepcopy(info), api=api.url, cache=ExtractCache(directory))
+        assert len(api.requests) == 10
+
+        cache = ExtractCache(directory)
+        assert _create_id_to_metadata(deepcopy(info), api=api.url, cache=cache) == expected
+        assert len(api.requests) == 10
+        assert cache.hits == 10
+
+        # A new revision of one article is fetched again
+        changed = deepcopy(info)
+        changed[3]['timestamp'] = '1300000000'
+        _create_id_to_metadata(changed, api=api.url, cache=ExtractCache(directory))
+        assert api.requests[10:] == [['1003']]
+
+        cache = ExtractCache(directory, revalidate=True)
+        _create_id_to_metadata(deepcopy(info), api=api.url, cache=cache)
+        assert len(api.requests) == 21
+        assert cache.changed == 0
+
+        # Least recently used extracts are evicted past the size limit
+        size = len(extracts['1000'].encode())
+        cache = ExtractCache(directory, max_bytes=size * 4)
+        assert cache.size <= size * 4
+        assert cache.get('1009', info[9]['timestamp']) is not None
+        assert cache.get('1000', info[0]['timestamp']) is None
+
+def test_reindex():
+    ''' Tests that re-indexing only fetches changed articles and patches the maps. '''
+    info, extracts = fake_articles(10)
+    metadata = [_article_row(item, _find_keywords(extracts[item['id']])) for item in info]
+    titles = title_to_info(metadata)
+    keywords = keyword_to_titles(metadata)
+
+    info[2]['timestamp'] = '1300000000'
+    extracts['1002'] = ' '.join(['changed number4'] * 6)
+    del info[5]
+    new_info, new_extracts = fake_articles(12)
+    info.append(new_info[11])
+    extracts.update(new_extracts)
+
+    with FakeWikiAPI(extracts) as api:
+        delta = _reindex(deepcopy(info), metadata, titles, keywords, api=api.url)
+        assert sorted(api.requests) == [['1002'], ['1011']]
+    assert delta == {'added': ['Article 11'], 'updated': ['Article 2'], 'removed': ['Article 5'], 'failed': []}
+
+    expected = [_article_row(item, _find_keywords(extracts[item['id']])) for item in info]
+    assert metadata == expected
+    assert titles == title_to_info(expected)
+    assert keywords == keyword_to_titles(expected)
+
+    # Maps left out default to the live ones, which are marked changed once patched
+    metadata = deepcopy(article_metadata())
+    unchanged = [{'title': row[0], 'id': str(number), 'timestamp': str(row[2]), 'num_characters': str(row[3])}
+                 for number, row in enumerate(metadata)]
+    version = data_version()
+    delta = _reindex(unchanged, metadata)
+    assert delta == {'added': [], 'updated': [], 'removed': [], 'failed': []}
+    assert metadata == article_metadata()
+    assert data_version() == version + 1
+
+def test_find_keywords():
+    ''' Tests that _find_keywords() matches the original implementation. '''
+    samples = ['', '...', 'the the the the the the', '  The THE the, the; the. the!\n',
+               'snake_case snake_case snake_case snake_case snake_case snake_case',
+               ' '.join(['İstanbul ISTANBUL straße STRASSE Ünïcödé'] * 7),
+               ' '.join(['ab abc abcd 123 1234 x_y'] * 6)]
+    words = ['music', 'Music', 'the', 'a', 'rock', 'jazz', 'hip-hop', 'café', '1986', 'it\'s']
+    samples += [fake_extract(words, length, seed) for seed, length in enumerate([100, 5000, 50000])]
+    for sample in samples:
+        assert _find_keywords(sample) == reference_find_keywords(sample)
+
+def test_streaming_tokenizer():
+    ''' Tests that chunked tokenizing finds the same words with bounded memory. '''
+    words = ['music', 'Music', 'the', 'a', 'rock', 'jazz', 'hip-hop', 'café', '1986', 'it\'s', 'x' * 50]
+    text = fake_extract(words, 20000, 3)
+    for size in [1, 2, 3, 7, 64, 1000, 30000]:
+        assert list(_tokenize(_chunks(text, size))) == re.findall(r'\w+', text)
+        assert _find_keywords_stream(_chunks(io.StringIO(text), size)) == reference_find_keywords(text)
+    assert list(_tokenize(['ab', 'cd', ' e', 'f'])) == ['abcd', 'ef']
+
+    # Count 2MB of text, read in chunks, without ever holding it all
+    chunks = (text + ' ' for _ in range(100))
+    tracemalloc.start()
+    try:
+        _find_keywords_stream(chunks)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 512 * 1024
+
+if __name__ == "__main__":
+    test_concurrent_fetch()
+    test_metadata_list_failures()
+    test_batched_fetch()
+    test_pipeline()
+    test_token_bucket()
+    test_extract_cache()
+    test_reindex()
+    test_find_keywords()
+    test_streaming_tokenizer()
@@ -0,0 +1,120 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+import threading
+
+class FakeWikiAPI:
+    """
+    Local stand-in for the MediaWiki extracts API, serving fixed extracts
+
+    Args:
+      extracts - dictionary mapping page ID (string) to plain text extract
+      failing - page IDs whose requests get a 500 response
+      flaky - dictionary mapping page ID to the number of 503 responses its
+              requests get before they succeed
+    """
+
+    def __init__(self, extracts, failing=(), flaky=None):
+        self.extracts = extracts
+        self.failing = set(failing)
+        self.flaky = dict(flaky or {})
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/w/api.php?action=query&format=json&prop=extracts' \
+            '&pageids={{}}&formatversion=2&explaintext=1'.format(self._server.server_port)
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections alive between requests like the real API
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                page_ids = parse_qs(urlparse(self.path).query)['pageids'][0].split('|')
+                with api._lock:
+                    api.requests.append(page_ids)
+                    flaky = [page_id for page_id in page_ids if api.flaky.get(page_id)]
+                    for page_id in flaky:
+                        api.flaky[page_id] -= 1
+                if flaky or api.failing.intersection(page_ids):
+                    self.send_response(503 if flaky else 500)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                pages = []
+                for page_id in page_ids:
+                    if page_id in api.extracts:
+                        pages.append({'pageid': int(page_id), 'extract': api.extracts[page_id]})
+                    else:
+                        pages.append({'pageid': int(page_id), 'missing': True})
+                body = json.dumps({'query': {'pages': pages}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+def fake_articles(count):
+    """
+    Returns (info, extracts) for count made up articles, where info is in the
+    BigQuery shape the ingestion functions take
+    """
+    info = []
+    extracts = {}
+    for number in range(count):
+        article_id = str(1000 + number)
+        info.append({'title': 'Article {}'.format(number), 'contributor_username': 'author',
+                     'id': article_id, 'timestamp': str(1234567890 + number), 'num_characters': '100'})
+        extracts[article_id] = ' '.join(['shared word number{}'.format(number)] * 6)
+    return info, extracts
+
+def reference_find_keywords(article, threshold=5):
+    """
+    Returns the keywords of article the way the original wiki._find_keywords()
+    found them, to check faster versions against
+    """
+    keywords = []
+    count = {}
+    article = re.sub(r'\W+', ' ', article).split(' ')
+    for word in article:
+        count[word.lower()] = count[word.lower()] + 1 if word.lower() in count.keys() else 1
+    for key, value in count.items():
+        if value > threshold and len(key) > 2:
+            keywords.append(key)
+    return keywords
+
+def fake_extract(words, length, seed=0):
+    """
+    Returns about length characters of extract-like text built from words,
+    with mixed case, punctuation and line breaks
+    """
+    chooser = random.Random(seed)
+    separators = [' ', ' ', ' ', ', ', '. ', ' (', ') ', '\n\n', ' - ', '; ']
+    parts = []
+    size = 0
+    while size < length:
+        word = chooser.choice(words)
+        if chooser.random() < 0.1:
+            word = word.capitalize()
+        parts.append(word + chooser.choice(separators))
+        size += len(parts[-1])
+    return ''.join(parts)
@@ -0,0 +1,196 @@
+from index import difference, intersect, metadata_index, union
+from datetime import MAXYEAR, MINYEAR
+import calendar
+import re
+
+# Operators are only recognized in upper case, so 'and', 'or' and 'not' can
+# still be searched for as keywords
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# Range filters on numeric fields, as in length<=5000 or timestamp>1200000000
+_COMPARISON = re.compile(r'(length|timestamp)(<=|>=|<|>|=)(\d+)$')
+# Timestamp filters by year, as in after:2008 or before:2008
+_YEAR = re.compile(r'(after|before):(\d{4})$')
+
+_TOKEN = re.compile(r'[()]|[^\s()]+')
+
+def is_query(text):
+  """ Returns True if text uses boolean operators, parentheses or range
+  filters rather than being a single keyword
+  """
+  tokens = _TOKEN.findall(text)
+  # A lone operator has nothing to combine, so it is searched for as a keyword
+  if len(tokens) == 1 and tokens[0] in OPERATORS:
+    return False
+  return any(token in OPERATORS or token in '()' or _range(token) for token in tokens)
+
+def _range(token):
+  """ Returns the ('range', field, low, high) node for a range filter token,
+  with inclusive bounds and None for an open side, or None for other tokens
+  """
+  comparison = _COMPARISON.match(token)
+  if comparison:
+    field, operator, value = comparison.groups()
+    value = int(value)
+    low, high = {'<=': (None, value), '<': (None, value - 1), '>=': (value, None),
+                 '>': (value + 1, None), '=': (value, value)}[operator]
+    return ('range', field, low, high)
+  year = _YEAR.match(token)
+  if year:
+    # after:2008 starts with 2009, before:2008 ends with 2007, both in UTC
+    which, value = year.groups()
+    boundary = int(value) + 1 if which == 'after' else int(value)
+    if not MINYEAR <= boundary <= MAXYEAR:
+      # calendar.timegm() has no timestamp for it, so it is left as a word
+      return None
+    start = calendar.timegm((boundary, 1, 1, 0, 0, 0))
+    return ('range', 'timestamp', start, None) if which == 'after' else ('range', 'timestamp', None, start - 1)
+  return None
+
+def parse(text):
+  """Parses a boolean query into a tree of tuples
+
+  NOT binds tightest, then AND, then OR. Words next to each other without an
+  operator are ANDed, and 'a NOT b' means a AND NOT b, so
+  'music AND (rock OR jazz) NOT pop' parses to
+  ('and', [('term', 'music'), ('or', [('term', 'rock'), ('term', 'jazz')]), ('not', ('term', 'pop'))]).
+
+  'length<=5000' parses to ('range', 'length', None, 5000) and 'after:2008'
+  to ('range', 'timestamp', 1230768000, None), filters that combine with
+  words like any other operand, as in 'music length<=5000 after:2008'.
+
+  Args:
+    text - query string
+
+  Raises ValueError if the query is empty or malformed
+  """
+  tokens = _TOKEN.findall(text)
+  position = 0
+
+  def peek():
+    return tokens[position] if position < len(tokens) else None
+
+  def take():
+    nonlocal position
+    token = peek()
+    if token is None:
+      raise ValueError('unexpected end of query: ' + text)
+    position += 1
+    return token
+
+  def or_expression():
+    operands = [and_expression()]
+    while peek() == 'OR':
+      take()
+      operands.append(and_expression())
+    return operands[0] if len(operands) == 1 else ('or', operands)
+
+  def and_expression():
+    operands = [unary()]
+    while peek() not in (None, 'OR', ')'):
+      if peek() == 'AND':
+        take()
+      operands.append(unary())
+    return operands[0] if len(operands) == 1 else ('and', operands)
+
+  def unary():
+    token = take()
+    if token == 'NOT':
+      return ('not', unary())
+    if token == '(':
+      node = or_expression()
+      if take() != ')':
+        raise ValueError('expected ) in query: ' + text)
+      return node
+    node = _range(token)
+    if node:
+      return node
+    if token in OPERATORS or token == ')':
+      raise ValueError('unexpected {} in query: {}'.format(token, text))
+    return ('term', token)
+
+  node = or_expression()
+  if peek() is not None:
+    raise ValueError('unexpected {} in query: {}'.format(peek(), text))
+  return node
+
+def evaluate(node, postings, universe, numeric=None):
+  """Returns the sorted rows matching a parsed query
+
+  AND operands are intersected smallest first, stopping once the result is
+  empty, and negated operands are subtracted from the result afterwards, so
+  the whole collection is only needed for a query that is negated as a whole.
+
+  Args:
+    node - query tree from parse()
+    postings - function returning the sorted rows of a keyword
+    universe - function returning the sorted rows of all articles
+    numeric - function returning the index.NumericIndex of a field over the
+              same rows for range filters; without one they raise ValueError
+  """
+  kind = node[0]
+  if kind == 'term':
+    return postings(node[1])
+  if kind == 'range':
+    if numeric is None:
+      raise ValueError('range filters need numeric indexes')
+    return numeric(node[1]).rows(*node[2:])
+  if kind == 'not':
+    return difference(universe(), evaluate(node[1], postings, universe, numeric))
+  if kind == 'or':
+    result = evaluate(node[1][0], postings, universe, numeric)
+    for operand in node[1][1:]:
+      result = union(result, evaluate(operand, postings, universe, numeric))
+    return result
+
+  # Range filters narrow the other operands' result down rather than being
+  # intersected with it
+  included = [operand for operand in node[1] if operand[0] not in ('not', 'range')]
+  excluded = [operand[1] for operand in node[1] if operand[0] == 'not']
+  filters = [operand for operand in node[1] if operand[0] == 'range']
+  if not included and filters:
+    included.append(filters.pop())
+  if included:
+    lists = sorted((evaluate(operand, postings, universe, numeric) for operand in included), key=len)
+    result = lists[0]
+    for posting in lists[1:]:
+      if not result:
+        break
+      result = intersect(result, posting)
+  else:
+    result = universe()
+  for operand in filters:
+    if not result:
+      break
+    if numeric is None:
+      raise ValueError('range filters need numeric indexes')
+    result = numeric(operand[1]).filter(result, *operand[2:])
+  for operand in excluded:
+    if not result:
+      break
+    result = difference(result, evaluate(operand, postings, universe, numeric))
+  return result
+
+def boolean_rows(text):
+  """ Returns the sorted positions of the rows matching a boolean query of
+  keywords. Raises ValueError if the query is malformed
+  """
+  index = metadata_index()
+  return evaluate(parse(text), index.postings, lambda: list(range(len(index.metadata))), index.numeric)
+
+def search_rows(text):
+  """ Returns the positions of the rows search() lists for text, those
+  matching it as a boolean query or, for a single keyword, each row listing
+  it once per listing. Raises ValueError if the query is malformed
+  """
+  if is_query(text):
+    return boolean_rows(text)
+  return metadata_index().rows(text)
+
+def boolean_search(text):
+  """ Returns [title, author, timestamp, article length] for each article
+  matching a boolean query of keywords, in the order search() lists them;
+  raises ValueError if the query is malformed
+  """
+  metadata = metadata_index().metadata
+  return [metadata[row][:4] for row in boolean_rows(text)]
@@ -1,4 +1,6 @@
-from wiki import article_metadata, ask_search, ask_advanced_search
+from wiki import ask_search, ask_advanced_search
+from index import metadata_index
+from query import boolean_search, is_query, search_rows
 
 # FOR ALL OF THESE FUNCTIONS, READ THE FULL INSTRUCTIONS.
 
@@ -17,14 +19,14 @@ from wiki import article_metadata, ask_search, ask_advanced_search
 # TODO Write code for #1 here
 
 def search(keyword):
-    new_keyword = keyword.lower()
-    new_list = []
-    
-    for lists in  article_metadata():
-        for list in lists[4]:
-            if new_keyword == list.lower():
-                new_list.append(lists[:4])
-    return new_list            
+    # Keywords combined with AND, OR, NOT and parentheses, or range filters
+    # as in length<=5000, are a boolean query
+    if is_query(keyword):
+        try:
+            return boolean_search(keyword)
+        except ValueError:
+            return []
+    return metadata_index().lookup(keyword)
   
    
     
@@ -162,7 +164,8 @@ def multiple_keywords(keyword, metadata):
 # Prints out articles based on searched keyword and advanced options
 def display_result():
     # Stores list of articles returned from searching user's keyword
-    articles = search(ask_search())
+    keyword = ask_search()
+    articles = search(keyword)
 
     # advanced stores user's chosen advanced option (1-5)
     # value stores user's response in being asked the advanced option
@@ -171,8 +174,11 @@ def display_result():
     if advanced == 1:
         # value stores max article title length in number of characters
         # Update article metadata to contain only ones of the maximum length
-        # TODO uncomment following line after writing the function and delete pass
-        articles = article_length(value, articles)
+        # The length index narrows the rows found for the keyword down directly,
+        # giving the same articles as article_length(value, articles)
+        index = metadata_index()
+        rows = index.numeric('length').filter(search_rows(keyword), high=value) if articles else []
+        articles = [index.metadata[row][:4] for row in rows]
         
     if advanced == 2:
         # value stores max number of articles
@@ -1,6 +1,8 @@
 from search import search, article_length, article_count, random_article, favorite_author, title_author, multiple_keywords, display_result
 from search_tests_helper import get_print, print_basic, print_advanced, print_advanced_option
 from wiki import article_metadata
+from index import MetadataIndex, NumericIndex, difference, intersect, union
+from query import evaluate, is_query, parse
 from unittest.mock import patch
 
 # List of all available article titles for this search engine
@@ -263,6 +265,113 @@ def test_integration_travel_7(input_mock):
     expected = print_basic() + keyword + '\n' + print_advanced() + str(advanced_option) + "\n\nHere are your articles: [['Time travel', 'Thug outlaw69', 1140826049, 35170]] \n"    
 
 
+def test_metadata_index():
+    ''' Tests for the keyword to row index behind search(). '''
+    fake_metadata = [['an article', 'andrea', 1234567890, 103, ['Dog', 'cat']],
+                     ['another article', 'helloworld', 987123456, 8029, ['dog', 'dog']]]
+    index = MetadataIndex(fake_metadata)
+    assert index.rows('DOG') == [0, 1, 1]
+    assert index.lookup('cat') == [['an article', 'andrea', 1234567890, 103]]
+    assert index.lookup('bird') == []
+
+    # Adding an article to the underlying metadata rebuilds the index on next search
+    METADATA.append(['Zzyzx', 'andrea', 1234567890, 103, ['zzyzx']])
+    try:
+        assert search('ZZYZX') == [['Zzyzx', 'andrea', 1234567890, 103]]
+    finally:
+        METADATA.pop()
+    assert search('zzyzx') == []
+
+
+def test_boolean_search():
+    ''' Tests boolean queries over the keyword index. '''
+    assert parse('music AND (rock OR jazz) NOT pop') == \
+        ('and', [('term', 'music'), ('or', [('term', 'rock'), ('term', 'jazz')]), ('not', ('term', 'pop'))])
+    assert parse('dog cat OR bird') == ('or', [('and', [('term', 'dog'), ('term', 'cat')]), ('term', 'bird')])
+    assert is_query('dog OR cat') and is_query('(dog)')
+    assert not is_query('dog') and not is_query('and')
+    # A lone operator is still a keyword
+    assert not is_query('AND') and not is_query('NOT') and is_query('AND OR')
+    assert search('AND') == search('and') and len(search('AND')) == 79
+    assert search('NOT') == search('not') and len(search('NOT')) == 24
+    for malformed in ['', 'dog AND', '(dog', 'dog)', 'OR dog', 'NOT']:
+        try:
+            parse(malformed)
+            assert False, malformed
+        except ValueError:
+            pass
+
+    assert intersect([1, 3, 5], [3, 4, 5, 6]) == [3, 5]
+    assert intersect([40], list(range(100))) == [40]
+    assert union([1, 3], [2, 3, 7]) == [1, 2, 3, 7]
+    assert difference([1, 2, 3, 8], [2, 8, 9]) == [1, 3]
+
+    fake_metadata = [['a', 'x', 1, 10, ['rock', 'music', 'rock']],
+                     ['b', 'x', 2, 20, ['jazz', 'music']],
+                     ['c', 'x', 3, 30, ['pop', 'music', 'jazz']],
+                     ['d', 'x', 4, 40, ['rock']]]
+    index = MetadataIndex(fake_metadata)
+    universe = lambda: list(range(len(fake_metadata)))
+    assert index.postings('ROCK') == [0, 3]
+    assert evaluate(parse('music AND (rock OR jazz) NOT pop'), index.postings, universe) == [0, 1]
+    assert evaluate(parse('rock OR pop'), index.postings, universe) == [0, 2, 3]
+    assert evaluate(parse('NOT music'), index.postings, universe) == [3]
+    assert evaluate(parse('NOT (jazz OR rock)'), index.postings, universe) == []
+
+    music = search('music')
+    assert search('music AND music') == music
+    assert search('music OR music') == music
+    assert search('music NOT soccer') == [row for row in music if row not in search('soccer')]
+    assert search('music AND') == []
+    assert multiple_keywords('dog OR soccer', []) == [row for row in [article[:4] for article in METADATA] if row in search('dog') + search('soccer')]
+
+
+@patch('builtins.input')
+def test_numeric_index(input_mock):
+    ''' Tests range filters over sorted length and timestamp columns. '''
+    lengths = NumericIndex([500, 20, 300, 20, 9000])
+    assert lengths.span(20, 300) == [1, 3, 2]
+    assert lengths.rows(high=300) == [1, 2, 3]
+    assert lengths.rows(low=301) == [0, 4]
+    assert lengths.rows(600, 800) == []
+    assert list(lengths.ranks) == [3, 0, 2, 1, 4]
+    assert lengths.filter([0, 1, 4], high=500) == [0, 1]
+    assert lengths.filter([2], high=500) == [2]
+    assert lengths.filter([0, 3]) == [0, 3]
+
+    assert parse('music length<=5000 after:2008') == \
+        ('and', [('term', 'music'), ('range', 'length', None, 5000), ('range', 'timestamp', 1230768000, None)])
+    assert parse('length>5') == ('range', 'length', 6, None)
+    assert parse('before:2008') == ('range', 'timestamp', None, 1199145599)
+    assert is_query('length<=5') and not is_query('length')
+    # Years calendar.timegm() has no timestamp for are left as words
+    assert is_query('after:9998') and not is_query('after:9999') and not is_query('before:0000')
+    for keyword in ['after:9999', 'before:0000', 'dog before:0000']:
+        assert search(keyword) == []
+
+    for keyword in ['music', 'dog', 'soccer', 'nothing']:
+        for max_length in [0, 3000, 8000, 200000]:
+            assert search(keyword + ' length<=' + str(max_length)) == article_length(max_length, search(keyword))
+    assert search('music after:2008') == [row for row in search('music') if row[2] >= 1230768000]
+    assert search('music NOT after:2008') == [row for row in search('music') if row[2] < 1230768000]
+    assert search('length<=40') == [article[:4] for article in METADATA if article[3] <= 40]
+
+    keyword = 'dog'
+    advanced_option = 1
+    advanced_response = 8000
+    output = get_print(input_mock, [keyword, advanced_option, advanced_response])
+    expected = print_basic() + keyword + '\n' + print_advanced() + str(advanced_option) + '\n' + print_advanced_option(advanced_option) + str(advanced_response) + "\n\nHere are your articles: [['Mexican dog-faced bat', 'AnomieBOT', 1255316429, 1138], ['Guide dog', 'Sarranduin', 1165601603, 7339]]\n"
+    assert output == expected
+
+    # The length option keeps what article_length() would, lone operators included
+    for keyword in ['AND', 'NOT', 'dog']:
+        articles = article_length(10 ** 9, search(keyword))
+        assert len(articles) == len(search(keyword)) > 0
+        output = get_print(input_mock, [keyword, 1, 10 ** 9])
+        assert output.endswith('Here are your articles: ' + str(articles) + '\n')
+    assert lengths.filter([1, 1, 2, 4, 4], high=300) == [1, 1, 2]
+
+
 # Write tests above this line. Do not remove.
 
 # This automatically gets called when this file runs - this is how Python works.
@@ -281,4 +390,7 @@ if __name__ == "__main__":
     test_integration_school_4()
     test_integration_programming_5()
     test_integration_dog_6()
-    test_integration_travel_7()
\ No newline at end of file
+    test_integration_travel_7()
+    test_metadata_index()
+    test_boolean_search()
+    test_numeric_index()
\ No newline at end of file